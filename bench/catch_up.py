@@ -0,0 +1,92 @@
+"""Measure the catch-up of the schedules after the app was closed for a while.
+
+A database with a few thousand active schedules (weekly, monthly, yearly and
+one-time), and many finished ones, is examined last `--away` days ago. Then
+`DataManager.load_data` generates the tasks and todos of the missed days, and
+the time of the catch-up is reported. The run is repeated on a fresh copy of
+the database, to check that the same tasks are generated with the same ids.
+
+Run it from the project root:
+
+    python bench/catch_up.py [--schedules 5000] [--done 50000] [--away 30]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import db
+from datamanager import DataManager
+from model.scheduledtask import PeriodicScheduler
+
+def make_database(path, n_schedules, n_done, today, away):
+    rng = random.Random(42)
+    last_gen = today - away
+    def pattern():
+        kind = rng.randrange(4)
+        if kind == 0:
+            return PeriodicScheduler(weekday=rng.randrange(7)), 0
+        if kind == 1:
+            return PeriodicScheduler(day=rng.randint(1, 31)), 0
+        if kind == 2:
+            return PeriodicScheduler(month=rng.randint(1, 12), day=rng.randint(1, 28)), 0
+        return PeriodicScheduler(), last_gen + rng.randint(1, away * 2)
+    rows = []
+    no_repeat = PeriodicScheduler().repeat_fields().values()
+    for i in range(n_done):
+        rows.append((f'done {i}', 1, last_gen - rng.randint(1, 1000), 0, *no_repeat, 1, 0))
+    for i in range(n_schedules):
+        scheduler, once = pattern()
+        rows.append((f'schedule {i}', rng.randint(1, 4), once, last_gen,
+            *scheduler.repeat_fields().values(), 0, last_gen))
+    rng.shuffle(rows)
+    db.open_database(path, profile_name='fast')
+    def job(conn):
+        conn.executemany('''INSERT INTO repeated_task (title, tomato, once, next_event,
+            repeat_year, repeat_month, repeat_day, repeat_weekday, done, last_gen)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+    db.submit(job)
+    db.close_database()
+
+def catch_up(path, today):
+    """Return the seconds of the catch-up, the number of backfilled tasks and all the generated rows."""
+    dm = DataManager(path, profile='fast')
+    begin = time.perf_counter()
+    backfilled = dm.load_data(today)
+    elapsed = time.perf_counter() - begin
+    rows = db.execute_query('''SELECT id, description FROM task WHERE description <> ''
+        UNION ALL SELECT id, description FROM todo''', ())
+    dm.close()
+    return elapsed, len(backfilled), [tuple(row) for row in rows]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--schedules', type=int, default=5000)
+    parser.add_argument('--done', type=int, default=50000)
+    parser.add_argument('--away', type=int, default=30, help='the number of days the app was closed')
+    args = parser.parse_args()
+
+    today = date.today().toordinal()
+    tmp = tempfile.mkdtemp()
+    try:
+        template = os.path.join(tmp, 'template.sqlite3')
+        make_database(template, args.schedules, args.done, today, args.away)
+        results = []
+        for run in range(2):
+            path = os.path.join(tmp, f'run{run}.sqlite3')
+            shutil.copy(template, path)
+            results.append(catch_up(path, today))
+        (elapsed, n_backfilled, rows), (_, _, rows_again) = results
+        print(f'{args.schedules} schedules, {args.done} done, {args.away} days away')
+        print(f'catch-up: {elapsed * 1000:.0f} ms, {len(rows)} tasks and todos, {n_backfilled} of the past days')
+        print(f'deterministic: {rows == rows_again}')
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Compare the database profiles in `db.PROFILES`.
+
+For each profile, a synthetic database with a few hundred thousand sessions is
+created, then the commit latency of single row inserts and the read throughput
+of a full `session` scan and of the "today" history query are measured.
+
+Run it from the project root:
+
+    python bench/db_profiles.py [--sessions 300000] [--commits 200]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import db
+
+def make_database(path, n_sessions, n_tasks=500):
+    """Create a database with `n_sessions` sessions spread over the last few years."""
+    db.open_database(path, profile_name='fast')
+    now = int(time.time())
+    rng = random.Random(42)
+    def job(conn):
+        conn.executemany('INSERT INTO task (description, tomato) VALUES (?, ?)',
+            ((f'task {i}', rng.randint(1, 5)) for i in range(n_tasks)))
+        conn.executemany('INSERT INTO session (task, start, end, note) VALUES (?, ?, ?, ?)',
+            ((rng.randint(1, n_tasks), start, start + 1500, f'note {i}')
+                for i, start in enumerate(sorted(
+                    now - rng.randint(0, 3 * 365 * 86400) for _ in range(n_sessions)))))
+    db.submit(job)
+    db.close_database()
+
+def measure_commits(n_commits):
+    sql = 'INSERT INTO session (task, start, end, note) VALUES (?, ?, ?, ?)'
+    latencies = []
+    for i in range(n_commits):
+        begin = time.perf_counter()
+        db.execute_commit(sql, (1, i, i + 1500, ''))
+        latencies.append(time.perf_counter() - begin)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95)]
+
+def measure_reads():
+    begin = time.perf_counter()
+    cur = db.db.execute('SELECT * FROM session')
+    n_rows = 0
+    while True:
+        rows = cur.fetchmany(1000)
+        if not rows:
+            break
+        n_rows += len(rows)
+    scan = n_rows / (time.perf_counter() - begin)
+
+    start_of_today = time.time() - 86400
+    sql = '''SELECT t.description, s.start, s.end, s.note
+        FROM session as s, task as t
+        WHERE s.start > ? AND s.task = t.id'''
+    begin = time.perf_counter()
+    n_queries = 20
+    for i in range(n_queries):
+        db.execute_query(sql, (start_of_today,))
+    today = (time.perf_counter() - begin) / n_queries
+    return scan, today
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=300000)
+    parser.add_argument('--commits', type=int, default=200)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        template = os.path.join(tmpdir, 'template.sqlite3')
+        print(f'creating a database with {args.sessions} sessions ...')
+        make_database(template, args.sessions)
+        print(f'{"profile":10} {"commit p50":>12} {"commit p95":>12} {"scan rows/s":>14} {"today query":>12}')
+        for name in db.PROFILES:
+            path = os.path.join(tmpdir, f'{name}.sqlite3')
+            shutil.copyfile(template, path)
+            db.open_database(path, profile_name=name)
+            p50, p95 = measure_commits(args.commits)
+            scan, today = measure_reads()
+            db.close_database()
+            print(f'{name:10} {p50*1000:10.2f}ms {p95*1000:10.2f}ms {scan:14,.0f} {today*1000:10.2f}ms')
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
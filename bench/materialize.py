@@ -0,0 +1,83 @@
+"""Compare the ways to load `session` rows.
+
+* constructor: `Session(**row)` for every row, the old way of `query_db`.
+* query_db: the fast path of `Model._materialize`.
+* iter_rows: the read-only namedtuple rows.
+* sqlite3.Row: the raw rows, as a baseline.
+
+For each way, the time to load all rows and the memory held per row are
+reported.
+
+Run it from the project root:
+
+    python bench/materialize.py [--sessions 1000000]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import db
+from model.models import Session
+
+def make_sessions(n_sessions):
+    def job(conn):
+        conn.execute('''
+            WITH RECURSIVE seq(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM seq WHERE i < ?)
+            INSERT INTO session (task, start, end, note)
+            SELECT i % 500, 1600000000 + i * 1800, 1600000000 + i * 1800 + 1500, 'note ' || i
+            FROM seq''', (n_sessions,))
+    db.submit(job)
+
+def load_with_constructor():
+    rows = db.execute_query('SELECT * FROM session', ())
+    return [Session(**row) for row in rows]
+
+def load_with_query_db():
+    return Session.query_db(use_identity_map=False)
+
+def load_with_iter_rows():
+    return list(Session.iter_rows(batch_size=10000))
+
+def load_raw_rows():
+    return db.execute_query('SELECT * FROM session', ())
+
+def measure(load):
+    """Return the number of rows, the loading time and the memory held by the result.
+    
+    The memory is measured in a second run, since tracing slows down the
+    loading a lot.
+    """
+    gc.collect()
+    begin = time.perf_counter()
+    n_rows = len(load())
+    elapsed = time.perf_counter() - begin
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return n_rows, elapsed, memory
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1000000)
+    args = parser.parse_args()
+
+    db.open_database(':memory:', use_identity_map=False)
+    make_sessions(args.sessions)
+    print(f'{"method":14} {"seconds":>8} {"rows/s":>12} {"bytes/row":>10}')
+    for name, load in [
+            ('constructor', load_with_constructor),
+            ('query_db', load_with_query_db),
+            ('iter_rows', load_with_iter_rows),
+            ('sqlite3.Row', load_raw_rows)]:
+        n_rows, elapsed, memory = measure(load)
+        print(f'{name:14} {elapsed:8.2f} {n_rows/elapsed:12,.0f} {memory/n_rows:10.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Yearly archive databases for the old sessions and the finished tasks.
+
+`archive` moves the sessions and the done tasks that are older than a given
+number of days out of the app's database, into one database file per year
+next to it (`app.sqlite3` -> `app-2021.sqlite3`). A session belongs to the
+year it started, a task to the year it was completed. A done task is kept
+while it has recent sessions or unfinished subtasks.
+
+The archives are only `ATTACH`ed when a query asks for their years, see
+`union_view`, which returns a temporary view of a table in the app's
+database and the archives. An attached archive stays attached to its
+connection, and the list of the archived years is cached until the
+directory of the database changes.
+
+The session statistics (see migration 2) are not changed by archiving, and
+the archived notes and tasks drop out of the full-text search.
+"""
+import glob
+import os
+import re
+import sqlite3
+from datetime import date
+
+import db
+from dateutils import day_start
+
+# the columns of the archived tables, in the order of the app's tables
+COLUMNS = {
+    'session': ['id', 'task', 'start', 'end', 'note'],
+    'task': ['id', 'description', 'long_session', 'tomato', 'done',
+        'complete_time', 'deadline', 'progress', 'parent'],
+}
+
+ARCHIVE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS {schema}.session (
+        id INTEGER PRIMARY KEY,
+        task INTEGER,
+        start INTEGER NOT NULL,
+        end INTEGER NOT NULL,
+        note TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS {schema}.session_start ON session (start)',
+    'CREATE INDEX IF NOT EXISTS {schema}.session_task ON session (task)',
+    '''CREATE TABLE IF NOT EXISTS {schema}.task (
+        id INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        long_session INTEGER NOT NULL DEFAULT 0,
+        tomato INTEGER NOT NULL DEFAULT 1,
+        done INTEGER NOT NULL DEFAULT 0,
+        complete_time INTEGER,
+        deadline INTEGER,
+        progress INTEGER NOT NULL DEFAULT 0,
+        parent INTEGER
+    )''',
+]
+
+# the local year of a session, and of a task's completion day (a date ordinal)
+SESSION_YEAR = "CAST(strftime('%Y', start, 'unixepoch', 'localtime') AS INTEGER)"
+TASK_YEAR = "CAST(strftime('%Y', complete_time + 1721424.5) AS INTEGER)"
+
+ARCHIVED_SESSIONS = 'start < :cutoff'
+ARCHIVED_TASKS = '''done = 1 AND complete_time < :cutoff_day AND description <> ''
+    AND NOT EXISTS (SELECT 1 FROM main.session AS s WHERE s.task = task.id AND s.start >= :cutoff)
+    AND NOT EXISTS (SELECT 1 FROM main.task AS c WHERE c.parent = task.id AND c.done = 0)'''
+
+def database_path(conn):
+    """Return the file of the connection's main database, '' for an in-memory database."""
+    for _, name, path in conn.execute('PRAGMA database_list'):
+        if name == 'main':
+            return path
+    return ''
+
+def archive_path(db_path, year):
+    base, ext = os.path.splitext(db_path)
+    return f'{base}-{year}{ext}'
+
+# {database path: (modification time of its directory, archived years)}
+_archived_years = {}
+
+def archived_years(conn):
+    """Return the sorted list of the years that have an archive."""
+    db_path = database_path(conn)
+    if not db_path:
+        return []
+    # a new archive changes the directory, it's only listed again then
+    mtime = os.stat(os.path.dirname(db_path)).st_mtime_ns
+    cached = _archived_years.get(db_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    base, ext = os.path.splitext(db_path)
+    pattern = re.compile(re.escape(base) + r'-(\d{4})' + re.escape(ext) + '$')
+    matches = (pattern.match(path) for path in glob.glob(glob.escape(base) + '-*' + ext))
+    years = sorted(int(match.group(1)) for match in matches if match)
+    _archived_years[db_path] = (mtime, years)
+    return years
+
+def attach(conn, years, create=False):
+    """Attach the archives of `years`, return their schema names.
+
+    The archives that don't exist are skipped, unless `create` is true. If
+    there is no room for more attached databases, the archives that are not
+    in `years` are detached first.
+    """
+    db_path = database_path(conn)
+    attached = {name for _, name, _ in conn.execute('PRAGMA database_list')}
+    wanted = {f'archive_{year}': year for year in years}
+    if len(attached | set(wanted)) - 2 > conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):
+        for name in attached - set(wanted):
+            if name.startswith('archive_'):
+                conn.execute(f'DETACH DATABASE {name}')
+                attached.discard(name)
+    schemas = []
+    for schema, year in wanted.items():
+        path = archive_path(db_path, year)
+        if schema not in attached:
+            if not create and not os.path.exists(path):
+                continue
+            conn.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+            for sql in ARCHIVE_SCHEMA:
+                conn.execute(sql.format(schema=schema))
+        schemas.append(schema)
+    return schemas
+
+def union_view(conn, table, years=None):
+    """Return the name of a view of `table` in the app's database and the archives of `years`.
+
+    `years` defaults to all the archived years, the years that have no
+    archive are skipped. The view is a temporary view of the connection,
+    it's recreated only when the attached years change. If no archive is
+    needed, the table itself is returned.
+    """
+    available = archived_years(conn)
+    years = available if years is None else [year for year in years if year in available]
+    schemas = attach(conn, years)
+    if not schemas:
+        return table
+    columns = ', '.join(COLUMNS[table])
+    view = f'{table}_all'
+    sql = f'CREATE TEMP VIEW {view} AS ' + ' UNION ALL '.join(
+        f'SELECT {columns} FROM {schema}.{table}' for schema in ['main', *schemas])
+    current = conn.execute("SELECT sql FROM temp.sqlite_master WHERE name = ?", (view,)).fetchone()
+    if current is None or current[0] != sql:
+        conn.execute(f'DROP VIEW IF EXISTS temp.{view}')
+        conn.execute(sql)
+    return view
+
+def years_between(first_day, last_day):
+    """Return the years of the range of day ordinals."""
+    return range(date.fromordinal(first_day).year, date.fromordinal(last_day).year + 1)
+
+def archive(days, today=None):
+    """Move the sessions and the done tasks older than `days` days to the yearly archives.
+
+    Return a dict of {year: (number of sessions, number of tasks)} that are
+    archived. The rows are copied to an archive and committed before they
+    are deleted from the app's database, so an interrupted run never loses
+    data, and it can be run again.
+    """
+    cutoff_day = (today or date.today()).toordinal() - days
+    # the app's day begins at 1 AM, so a day is never split between the
+    # archive and the app's database (see `migrations.SESSION_DAY`)
+    cutoff = int(day_start(cutoff_day))
+    parameters = dict(cutoff=cutoff, cutoff_day=cutoff_day)
+    if not database_path(db.connection()):
+        raise ValueError("An in-memory database can't be archived.")
+    db.flush()
+    conn = db.connection()
+    years = sorted({year for year, in conn.execute(
+        f'''SELECT DISTINCT {SESSION_YEAR} FROM main.session WHERE {ARCHIVED_SESSIONS}
+        UNION SELECT DISTINCT {TASK_YEAR} FROM main.task WHERE {ARCHIVED_TASKS}''', parameters)})
+    archived = {}
+    for year in years:
+        schema, = attach(conn, [year], create=True)
+        _archived_years.pop(database_path(conn), None)
+        for table, year_of, condition in [
+                ('session', SESSION_YEAR, ARCHIVED_SESSIONS),
+                ('task', TASK_YEAR, ARCHIVED_TASKS)]:
+            columns = ', '.join(COLUMNS[table])
+            with db.transaction():
+                conn.execute(f'''INSERT OR REPLACE INTO {schema}.{table} ({columns})
+                    SELECT {columns} FROM main.{table} WHERE {condition} AND {year_of} = :year''',
+                    dict(parameters, year=year))
+            with db.transaction():
+                cur = conn.execute(f'''DELETE FROM main.{table}
+                    WHERE {condition} AND id IN (SELECT id FROM {schema}.{table})''', parameters)
+            archived.setdefault(year, []).append(cur.rowcount)
+    return {year: tuple(counts) for year, counts in archived.items()}
+
+def vacuum():
+    """Shrink the app's database file after archiving."""
+    db.flush()
+    db.connection().execute('VACUUM')
@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+from datetime import date, datetime
+
+import archive
+import db
+from model.models import Session, Task
+
+def timestamp(year, month, day, hour=10):
+    return int(datetime(year, month, day, hour).timestamp())
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.dir.name, 'app.sqlite3')
+        db.open_database(self.db_path)
+        self.old_task = Task.create(description='old', tomato=2, parent=None)
+        self.current_task = Task.create(description='current', tomato=5, parent=None)
+        for task, start in [
+                (self.old_task, timestamp(2020, 12, 31, 23)),
+                (self.old_task, timestamp(2021, 1, 2)),
+                (self.current_task, timestamp(2021, 3, 1)),
+                (self.current_task, timestamp(2022, 5, 1))]:
+            Session.create(task.id, start, start + 1500, 'note')
+        self.old_task.set_done(True)
+        self.old_task.complete_time = date(2021, 1, 3).toordinal()
+        self.old_task.save_to_db()
+        self.first_day, self.last_day = date(2020, 1, 1).toordinal(), date(2022, 12, 31).toordinal()
+
+    def tearDown(self) -> None:
+        db.close_database()
+        self.dir.cleanup()
+
+    def count(self, sql):
+        return db.execute_query(sql, ())[0][0]
+
+    def sessions(self, first_year, last_year):
+        "The (start, end, task, note) of the sessions in the app's database and the archives of the years."
+        table = archive.union_view(db.connection(), 'session', range(first_year, last_year + 1))
+        return [tuple(row) for row in db.execute_query(f'SELECT start, end, task, note FROM {table} ORDER BY start', ())]
+
+    def test_archive(self):
+        statistics = Session.daily_statistics(self.first_day, self.last_day)
+        history = self.sessions(2020, 2022)
+        archived = archive.archive(365, today=date(2022, 6, 1))
+        self.assertEqual(archived, {2020: (1, 0), 2021: (2, 1)})
+        self.assertEqual(archive.archived_years(db.connection()), [2020, 2021])
+        self.assertTrue(os.path.exists(os.path.join(self.dir.name, 'app-2021.sqlite3')))
+        self.assertEqual(self.count('SELECT count(*) FROM session'), 1)
+        self.assertEqual([task.id for task in Task.query_db()], [self.current_task.id])
+
+        self.assertEqual(self.sessions(2020, 2022), history)
+        self.assertEqual(len(Session.load_sessions_for_task(self.current_task.id)), 2)
+        self.assertEqual(Session.daily_statistics(self.first_day, self.last_day), statistics)
+        Session.rebuild_statistics()
+        self.assertEqual(Session.daily_statistics(self.first_day, self.last_day), statistics)
+        # running it again changes nothing
+        self.assertEqual(archive.archive(365, today=date(2022, 6, 1)), {})
+
+    def test_archives_are_attached_lazily(self):
+        archive.archive(365, today=date(2022, 6, 1))
+        db.close_database()
+        db.open_database(self.db_path)
+        conn = db.connection()
+        self.assertEqual(self.sessions(2022, 2022),
+            [(timestamp(2022, 5, 1), timestamp(2022, 5, 1) + 1500, self.current_task.id, 'note')])
+        attached = [name for _, name, _ in conn.execute('PRAGMA database_list')]
+        self.assertEqual(attached, ['main'])
+        self.assertEqual(len(self.sessions(2021, 2022)), 3)
+        attached = [name for _, name, _ in conn.execute('PRAGMA database_list')]
+        self.assertEqual(attached, ['main', 'temp', 'archive_2021'])
+        table = archive.union_view(conn, 'task')
+        self.assertEqual(self.count(f'SELECT count(*) FROM {table}'), 2)
+        self.assertIn('archive_2020', [name for _, name, _ in conn.execute('PRAGMA database_list')])
+
+    def test_only_the_years_of_the_task_are_attached(self):
+        archive.archive(365, today=date(2022, 6, 1))
+        db.close_database()
+        db.open_database(self.db_path)
+        conn = db.connection()
+        self.assertEqual(len(Session.load_sessions_for_task(self.current_task.id)), 2)
+        attached = [name for _, name, _ in conn.execute('PRAGMA database_list')]
+        self.assertEqual(attached, ['main', 'temp', 'archive_2021'])
+        task = Task.create(description='new', tomato=1, parent=None)
+        self.assertEqual(Session.load_sessions_for_task(task.id), [])
+
+    def test_archived_years_are_cached(self):
+        conn = db.connection()
+        self.assertEqual(archive.archived_years(conn), [])
+        archive.archive(365, today=date(2022, 6, 1))
+        self.assertEqual(archive.archived_years(conn), [2020, 2021])
+        self.assertIs(archive.archived_years(conn), archive.archived_years(conn))
+
+    def test_cutoff_is_the_start_of_the_day(self):
+        # the cutoff day is 2021-06-01, its sessions before 1 AM belong to the day before
+        for hour in [0, 2]:
+            Session.create(self.current_task.id, timestamp(2021, 6, 1, hour), timestamp(2021, 6, 1, hour) + 1500, '')
+        archive.archive(365, today=date(2022, 6, 1))
+        self.assertEqual(self.count('SELECT count(*) FROM session'), 2)
+        self.assertEqual(self.count('SELECT min(start) FROM session'), timestamp(2021, 6, 1, 2))
+
+    def test_rebuild_after_archive_keeps_the_boundary_day(self):
+        # the session at midnight belongs to 2021-05-31, which lasts until 1 AM
+        for start in [timestamp(2021, 5, 31, 12), timestamp(2021, 6, 1, 0), timestamp(2021, 6, 1, 2)]:
+            Session.create(self.current_task.id, start, start + 1500, '')
+        days = date(2021, 5, 30).toordinal(), date(2021, 6, 2).toordinal()
+        statistics = Session.daily_statistics(*days)
+        archive.archive(365, today=date(2022, 6, 1))
+        Session.rebuild_statistics()
+        self.assertEqual(Session.daily_statistics(*days), statistics)
+        self.assertEqual([day for day, *_ in statistics], [date(2021, 5, 31).toordinal(), date(2021, 6, 1).toordinal()])
+
+    def test_task_with_recent_sessions_is_kept(self):
+        self.current_task.set_done(True)
+        self.current_task.complete_time = date(2021, 1, 3).toordinal()
+        self.current_task.save_to_db()
+        archived = archive.archive(365, today=date(2022, 6, 1))
+        self.assertEqual(archived[2021], (2, 1))
+        self.assertEqual([task.id for task in Task.query_db()], [self.current_task.id])
@@ -0,0 +1,106 @@
+"""Command line tools for the app's database.
+
+Run them from the project root, for example:
+
+    python3 src/cli.py rebuild-stats
+    python3 src/cli.py archive --days 365
+    python3 src/cli.py export session --from 2021-01-01 --to 2021-12-31 -o 2021.csv
+    python3 src/cli.py import tasks.txt
+"""
+import argparse
+import sys
+from datetime import date
+
+import archive
+import db
+import export
+import taskimport
+from model import appconfig, models
+
+APP_DB = 'app.sqlite3'
+CONFIG_FILE = 'config.json'
+
+def rebuild_stats(args):
+    models.Session.rebuild_statistics()
+    print('Session statistics are rebuilt.')
+
+def archive_old_data(args):
+    days = args.days
+    if days is None:
+        days = appconfig.PomodoroTimerConfig(CONFIG_FILE).get_archive_after_days()
+    archived = archive.archive(days)
+    for year, (sessions, tasks) in archived.items():
+        print(f'{year}: archived {sessions} sessions and {tasks} tasks '
+            f'to {archive.archive_path(args.db, year)}')
+    if not archived:
+        print(f'Nothing is older than {days} days.')
+    elif args.vacuum:
+        archive.vacuum()
+
+def export_table(args):
+    first_day = args.first_day.toordinal() if args.first_day else None
+    last_day = args.last_day.toordinal() if args.last_day else None
+    format = args.format or ('jsonl' if args.output and args.output.endswith('.jsonl') else 'csv')
+    if args.output is None:
+        count = export.export(args.table, sys.stdout, format, first_day, last_day, args.task)
+    else:
+        with open(args.output, 'w', newline='', encoding='utf-8') as out:
+            count = export.export(args.table, out, format, first_day, last_day, args.task)
+    print(f'Exported {count} rows.', file=sys.stderr)
+
+def import_tasks(args):
+    with open(args.file, encoding='utf-8') as f:
+        report = taskimport.import_lines(f, batch_size=args.batch_size)
+    for error in report.errors:
+        print(f'{args.file}:{error.line_number}: {error.message}: {error.text}', file=sys.stderr)
+    print(f'Imported {report.tasks} tasks, {report.todos} todos and {report.schedules} '
+        f'scheduled tasks. Lines not imported: {len(report.errors)}.')
+    return 1 if report.errors else 0
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Pomodoro Timer database tools")
+    parser.add_argument('--db', default=APP_DB, help=f'the database file (default: {APP_DB})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild = subparsers.add_parser('rebuild-stats',
+        help='recalculate the daily and weekly session statistics')
+    rebuild.set_defaults(func=rebuild_stats)
+
+    archiving = subparsers.add_parser('archive',
+        help='move the old sessions and done tasks to the yearly archive files')
+    archiving.add_argument('--days', type=int,
+        help='archive the data older than this (default: database.archive_after_days in config.json)')
+    archiving.add_argument('--vacuum', action='store_true',
+        help='shrink the database file afterwards')
+    archiving.set_defaults(func=archive_old_data)
+
+    exporting = subparsers.add_parser('export', help='write a table to CSV or JSON Lines')
+    exporting.add_argument('table', choices=list(export.TABLES))
+    exporting.add_argument('-o', '--output', help='the output file (default: stdout)')
+    exporting.add_argument('--format', choices=export.FORMATS,
+        help='the output format (default: jsonl for *.jsonl output files, csv otherwise)')
+    exporting.add_argument('--from', dest='first_day', type=date.fromisoformat, metavar='YYYY-MM-DD',
+        help='only the rows of this day or later')
+    exporting.add_argument('--to', dest='last_day', type=date.fromisoformat, metavar='YYYY-MM-DD',
+        help='only the rows of this day or earlier')
+    exporting.add_argument('--task', type=int, help='only the rows of this task id')
+    exporting.set_defaults(func=export_table)
+
+    importing = subparsers.add_parser('import',
+        help='add the tasks of a text file, one extended task description per line')
+    importing.add_argument('file')
+    importing.add_argument('--batch-size', type=int, default=taskimport.BATCH_SIZE,
+        help=f'the number of rows saved in a transaction (default: {taskimport.BATCH_SIZE})')
+    importing.set_defaults(func=import_tasks)
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    db.open_database(args.db)
+    try:
+        return args.func(args)
+    finally:
+        db.close_database()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,26 +1,90 @@
 """Manage instance of task list, todo list, and scheduled tasks, corrdinate their
 interactions.
 """
+from collections import namedtuple
+import heapq
+
 from model import models
 from model.scheduledtask import ScheduledTask
 import db
 
+# a task or todo generated for a day on which the app didn't run
+Backfill = namedtuple('Backfill', 'day schedule entity')
+
 class DataManager:
-    def __init__(self, db_name):
-        db.open_database(db_name)
+    def __init__(self, db_name, write_behind=False, profile=db.DEFAULT_PROFILE):
+        db.open_database(db_name, write_behind, profile)
         
         self.task_list = models.TaskList()
         todo_task = models.Task.get_or_create_todo_task()
         self.todo_task = models.TodoTask(todo_task.id)
+        # a heap of (next due day, schedule id) of the active schedules, and
+        # the largest schedule id when it was updated, so that the schedules are only
+        # queried when one is due or a new one is created
+        self.upcoming = None
+        self.max_schedule_id = 0
         
     def load_data(self, today):
-        task_list = models.Task.load_list({'description <>': ''}, done=0)
+        """Load the tasks and todos, and generate the scheduled ones of `today`.
+        
+        The occurrences of the schedules since the last load are caught up
+        too. Return the list of `Backfill` of the tasks and todos generated
+        for the days before `today`, by day and schedule.
+        """
+        task_list = models.Task.load_tree()
         self.task_list.set_task_list(task_list)
         self.todo_task.load_todo_from_db()
         
-        for schdedule in ScheduledTask.query_db():
-            new_task = schdedule.get_task_for_date(today)
-            if isinstance(new_task, models.Todo):
-                self.todo_task.add_todo(new_task)
-            elif isinstance(new_task, models.Task):
-                self.task_list.add(new_task)
+        if not self.has_due_schedules(today):
+            return []
+        schedules = ScheduledTask.load_due(today)
+        tasks, _ = ScheduledTask.generate_all_until(schedules, today)
+        generated = [Backfill(*task) for task in tasks]
+        # the same order on every run, so are the ids of the new rows
+        generated.sort(key=lambda backfill: (backfill.day, backfill.schedule.id))
+        new_tasks = [b.entity for b in generated if isinstance(b.entity, models.Task)]
+        new_todos = [b.entity for b in generated if isinstance(b.entity, models.Todo)]
+        
+        # save the new tasks and the schedules' bookkeeping in one transaction
+        def save(conn):
+            models.Task.bulk_create(new_tasks, conn)
+            models.Todo.bulk_create(new_todos, conn)
+            ScheduledTask.save_generated(schedules, today, conn)
+        db.submit(save, urgent=True).result()
+        
+        while self.upcoming and self.upcoming[0][0] <= today:
+            heapq.heappop(self.upcoming)
+        self._push_upcoming(schedules)
+        
+        for new_todo in new_todos:
+            self.todo_task.add_todo(new_todo)
+        for new_task in new_tasks:
+            self.task_list.add(new_task)
+        return [backfill for backfill in generated if backfill.day < today]
+
+    def has_due_schedules(self, today):
+        """Is a schedule due on `today`? The new schedules are added to the heap of the upcoming events."""
+        max_id = ScheduledTask.execute_query('SELECT max(id) FROM repeated_task', ())[0][0] or 0
+        if self.upcoming is None:
+            self.upcoming = []
+            self._push_upcoming(ScheduledTask.query_db(done=0))
+        elif max_id > self.max_schedule_id:
+            self._push_upcoming(ScheduledTask.query_db({'id >': self.max_schedule_id}, done=0))
+        self.max_schedule_id = max_id
+        return bool(self.upcoming) and self.upcoming[0][0] <= today
+
+    def _push_upcoming(self, schedules):
+        for schedule in schedules:
+            day = schedule.next_due_day()
+            if day is not None:
+                heapq.heappush(self.upcoming, (day, schedule.id))
+
+    def due_soon(self, today, days):
+        """Return the unfinished tasks and todos that are overdue or due in `days` days, by deadline."""
+        items = [*models.Task.overdue(today), *models.Task.due_within(days, today),
+            *models.Todo.overdue(today), *models.Todo.due_within(days, today)]
+        return sorted(items, key=lambda item: item.deadline)
+
+    def close(self):
+        "Save all the pending changes and close the database."
+        db.close_database()
@@ -0,0 +1,92 @@
+import gc
+import unittest
+from datetime import date
+
+from datamanager import DataManager
+from model import models
+from model.scheduledtask import PeriodicScheduler, ScheduledTask
+
+class DataManagerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dm = DataManager(':memory:')
+        self.today = date(2021, 5, 12).toordinal()
+
+    def tearDown(self) -> None:
+        self.dm.close()
+
+    def count_tasks(self):
+        gc.collect()
+        return sum(1 for obj in gc.get_objects() if isinstance(obj, models.Task))
+
+    def test_query_returns_live_entity(self):
+        task = models.Task.create(description='Task', tomato=2)
+        self.assertIs(models.Task.query_db(id=task.id)[0], task)
+        loaded = models.Task.query_db(description='Task', use_identity_map=False)[0]
+        self.assertIsNot(loaded, task)
+
+    def test_reload_does_not_grow_object_count(self):
+        parent = models.Task.create(description='Parent', tomato=2, parent=None)
+        models.Task.create(description='Child', tomato=1, parent=parent.id)
+        del parent
+        self.dm.load_data(self.today)
+        # the GUI keeps references to the loaded tasks
+        shown = list(self.dm.task_list)
+        count = self.count_tasks()
+        for i in range(3):
+            self.dm.load_data(self.today)
+        self.assertEqual(self.count_tasks(), count)
+        parent = next(iter(self.dm.task_list))
+        self.assertIs(parent, shown[0])
+        self.assertEqual([t.description for t in parent.subtasks], ['Child'])
+
+    def test_due_soon(self):
+        today = self.today
+        tasks = [models.Task.create(description=f'Task {d}', tomato=1, parent=None, deadline=today + d)
+            for d in (-2, 0, 2, 3)]
+        models.Task.create(description='No deadline', tomato=1, parent=None)
+        tasks[0].set_done(True)
+        todo = models.Todo.create('Todo', today + 1)
+        models.Todo.create('Later', today + 9)
+        self.assertEqual(models.Task.due_within(3, today), tasks[1:3])
+        self.assertEqual(models.Task.overdue(today), [])
+        self.assertEqual(models.Todo.overdue(today + 2), [todo])
+        self.assertEqual(self.dm.due_soon(today, 3), [tasks[1], todo, tasks[2]])
+        self.assertEqual([task.is_rotten(today) for task in tasks], [False, True, False, False])
+        self.assertTrue(tasks[2].is_rotten(today + 5))
+
+    def test_only_due_schedules_are_loaded(self):
+        wednesday = self.today
+        weekly = PeriodicScheduler(-1, -1, -1, date.fromordinal(wednesday).weekday()).repeat_fields()
+        def create(title, **fields):
+            return ScheduledTask.create(**dict(dict(title=title, tomato=1, type='-', once=0), **fields))
+        create('Weekly', **weekly)
+        create('Once', once=wednesday + 2)
+        create('Finished', once=wednesday - 30, done=True, last_gen=wednesday - 30)
+        self.dm.load_data(wednesday)
+        self.assertEqual([task.description for task in self.dm.task_list], ['Weekly'])
+        # the next event of the weekly schedule is computed the next day
+        self.assertEqual(sorted(self.dm.upcoming), [(wednesday + 1, 1), (wednesday + 2, 2)])
+        self.assertEqual([s.title for s in ScheduledTask.load_due(wednesday + 1)], ['Weekly'])
+        last_gen = [row[0] for row in ScheduledTask.execute_query('SELECT last_gen FROM repeated_task', ())]
+        self.assertEqual(last_gen, [wednesday, 0, wednesday - 30])
+
+        create('New', once=wednesday + 1)
+        self.dm.load_data(wednesday + 1)
+        self.dm.load_data(wednesday + 2)
+        self.assertEqual([task.description for task in self.dm.task_list], ['Weekly', 'New', 'Once'])
+        self.assertEqual(self.dm.upcoming, [(wednesday + 7, 1)])
+
+    def test_missed_days_are_caught_up(self):
+        wednesday = self.today
+        weekly = PeriodicScheduler(-1, -1, -1, date.fromordinal(wednesday).weekday()).repeat_fields()
+        ScheduledTask.create(title='Weekly', tomato=1, type='-', once=0, **weekly,
+            next_event=wednesday, last_gen=wednesday - 1)
+        ScheduledTask.create(title='Todo', tomato=1, type='.', once=wednesday + 3,
+            last_gen=wednesday - 1)
+        backfilled = self.dm.load_data(wednesday + 14)
+        self.assertEqual([(b.day - wednesday, b.schedule.title) for b in backfilled],
+            [(0, 'Weekly'), (3, 'Todo'), (7, 'Weekly')])
+        self.assertEqual([task.description for task in self.dm.task_list], ['Weekly'] * 3)
+        self.assertEqual([task.id for task in self.dm.task_list], sorted(task.id for task in self.dm.task_list))
+        self.assertEqual([todo.description for todo in self.dm.todo_task.todos], ['Todo'])
+        self.assertEqual(self.dm.load_data(wednesday + 14), [])
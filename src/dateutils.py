@@ -10,6 +10,14 @@ class Weekdays(IntEnum):
     SATURDAY = 5
     SUNDAY = 6
 
+# the app's day begins at 1 AM, a session before belongs to the previous day
+DAY_START_HOUR = 1
+
+def day_start(day_ordinal):
+    "Return the timestamp of the start of a day (1:00 AM)."
+    the_day = date.fromordinal(day_ordinal)
+    return datetime(the_day.year, the_day.month, the_day.day, DAY_START_HOUR).timestamp()
+
 weekday_dict = dict((v, i) for i, v in enumerate(
     ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
 ))
@@ -1,28 +1,414 @@
+"""Database access for the app.
+
+All the writes go through `submit`, which returns a `concurrent.futures.Future`
+of the last row id. By default a write is executed and committed right away on
+the caller's thread (the synchronous mode, used by the tests). When the
+database is opened with `write_behind=True`, the writes are handed over to a
+background `WriteBehindWriter` thread, which groups them into one transaction
+per flush interval (or per batch), so that a slow commit doesn't block the GUI.
+A write whose result is waited for (`submit(job, urgent=True)`, e.g. an insert
+that needs the new row id) ends the batch, so it's committed right away.
+
+Reads flush the pending writes first, if there are any, so a query sees every
+write that has been submitted before it.
+
+Every connection is configured with one of the performance profiles in
+`PROFILES`, which trade durability for commit latency.
+
+The connections are managed by a `ConnectionManager`, each thread uses its own
+connection (see `connection`, `read_only_connection` and `transaction`). `db`
+is the connection of the thread that opened the database.
+"""
 import sqlite3
 import os
+import queue
+import threading
+import time
+import traceback
+import urllib.parse
+import weakref
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import migrations
 
 db = None
+writer = None
+profile = None
+# live entities of the open database, keyed by (table name, id), see noorm.Model
+identity_map = None
+_pending_identity_changes = deque()
+manager = None
+
+MB = 1024 * 1024
+# Connection settings, applied with PRAGMAs. A negative cache_size is in KiB.
+PROFILES = {
+    # every commit is synced to disk
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+    },
+    # WAL is only synced on checkpoints, a power loss may lose the last commits
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -8000,
+        'mmap_size': 64 * MB,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    # never wait for the disk, an OS crash may corrupt the database
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -32000,
+        'mmap_size': 256 * MB,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
+DEFAULT_PROFILE = 'balanced'
 
-def open_database(db_name):
-    global db
-    if db:
-        db.close()
-    new_datebase = not os.path.isfile(db_name)    
-    db = sqlite3.connect(db_name)
-    db.row_factory = sqlite3.Row
+def connect(db_name, profile_name=DEFAULT_PROFILE, **kw):
+    """Open a connection configured with the given profile.
+    
+    The keyword arguments are passed to `sqlite3.connect`.
+    """
+    if profile_name not in PROFILES:
+        raise ValueError(f'Unknown database profile "{profile_name}", '
+            f'choose one of: {", ".join(PROFILES)}')
+    conn = sqlite3.connect(db_name, **kw)
+    conn.row_factory = sqlite3.Row
+    for name, value in PROFILES[profile_name].items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+def open_database(db_name, write_behind=False, profile_name=DEFAULT_PROFILE, use_identity_map=True):
+    global db, writer, profile, identity_map, manager
+    close_database()
+    new_datebase = not os.path.isfile(db_name)
+    manager = ConnectionManager(db_name, profile_name)
+    db = manager.connection()
+    profile = profile_name
+    if use_identity_map:
+        identity_map = weakref.WeakValueDictionary()
     if new_datebase:
         cur = db.cursor()
         with open('pomodoro.sqlite3.sql') as f:
             cur.executescript(f.read())
         cur.close()
+    migrations.migrate(db)
+    if write_behind and db_name != ':memory:':
+        writer = WriteBehindWriter(manager)
+
+def describe_profile():
+    """Return a summary of the settings in effect on the open database."""
+    settings = ', '.join(f'{name}={db.execute(f"PRAGMA {name}").fetchone()[0]}'
+        for name in PROFILES[profile])
+    return f'{profile} ({settings})'
+
+def close_database():
+    """Flush the pending writes, stop the writer thread and close all the connections."""
+    global db, writer, identity_map, manager
+    if writer:
+        writer.close()
+        writer = None
+    if manager:
+        manager.close()
+        manager = None
+    db = None
+    identity_map = None
+    _pending_identity_changes.clear()
+
+def connection():
+    """Return the connection of the current thread."""
+    return manager.connection()
+
+def read_only_connection():
+    """Return the read-only connection of the current thread, for reports and statistics."""
+    return manager.read_only()
+
+def transaction():
+    """A context manager of a write transaction on the current thread's connection."""
+    return manager.transaction()
+
+def get_identity_map():
+    """Return the identity map, which is only used by the thread that opened the database."""
+    if identity_map is None or threading.get_ident() != manager.owner:
+        return None
+    # apply the changes made by the other threads
+    while _pending_identity_changes:
+        key, entity = _pending_identity_changes.popleft()
+        if entity is None:
+            identity_map.pop(key, None)
+        else:
+            identity_map[key] = entity
+    return identity_map
+
+def register_entity(key, entity):
+    """Add (or with `entity=None`, remove) an entity to the identity map.
+
+    On the owner thread the change is applied right away. A change made by
+    another thread (e.g. the writer thread) is queued, and applied when the
+    owner thread uses the identity map next time.
+    """
+    if identity_map is None:
+        return
+    owned_map = get_identity_map()
+    if owned_map is None:
+        _pending_identity_changes.append((key, entity))
+    elif entity is None:
+        owned_map.pop(key, None)
+    else:
+        owned_map[key] = entity
+
+def submit(job, urgent=False):
+    """Run `job(connection)` in a write transaction.
+
+    Return a Future of the job's return value. In the synchronous mode, the
+    job is done before returning, and its exception is raised directly. An
+    `urgent` job is committed without waiting for more jobs to batch, for the
+    callers that wait for the result.
+    """
+    if writer:
+        return writer.submit(job, urgent)
+    future = Future()
+    with transaction() as conn:
+        future.set_result(job(conn))
+    return future
+
+def submit_commit(sql, parameters, urgent=False):
+    """Execute a single statement, return a Future of the last row id."""
+    return submit(lambda conn: conn.execute(sql, parameters).lastrowid, urgent)
 
 def execute_commit(sql, parameters):
-    cur = db.cursor()
-    cur.execute(sql, parameters)
-    db.commit()
-    return cur.lastrowid
-    
+    """Execute a single statement, wait for the commit and return the last row id."""
+    return submit_commit(sql, parameters, urgent=True).result()
+
+def flush():
+    """Wait until all the submitted writes are committed."""
+    if writer and threading.current_thread() is not writer.thread:
+        writer.flush()
+
 def execute_query(sql, parameters):
-    cur = db.cursor()
+    flush()
+    cur = connection().cursor()
+    cur.execute(sql, parameters)
+    return cur.fetchall()
+
+def iter_batches(sql, parameters, batch_size=500, row_factory=None):
+    """Yield the result rows in lists of at most `batch_size` rows.
+
+    `row_factory` replaces the connection's row factory for this query.
+    """
+    flush()
+    cur = connection().cursor()
+    if row_factory is not None:
+        cur.row_factory = row_factory
     cur.execute(sql, parameters)
-    return cur.fetchall()
\ No newline at end of file
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+def iter_query(sql, parameters, batch_size=500, row_factory=None):
+    """Yield the result rows, fetching `batch_size` rows at a time."""
+    for rows in iter_batches(sql, parameters, batch_size, row_factory):
+        yield from rows
+
+class ConnectionManager:
+    """Hand out one connection per thread, so that any thread can use the database.
+    
+    Each thread gets a read-write connection (`connection`), and optionally a
+    read-only one (`read_only`) for the expensive queries. An in-memory
+    database is shared by all the threads. All the connections are closed by
+    `close`.
+    """
+    def __init__(self, db_name, profile_name=DEFAULT_PROFILE):
+        self.profile_name = profile_name
+        if db_name == ':memory:':
+            self.uri = f'file:pomodoro-memory-{id(self)}?mode=memory&cache=shared'
+            self.read_only_uri = self.uri
+        else:
+            path = urllib.parse.quote(os.path.abspath(db_name))
+            self.uri = f'file:{path}'
+            self.read_only_uri = f'file:{path}?mode=ro'
+        # the thread that opened the database
+        self.owner = threading.get_ident()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+        self.closed = False
+    
+    def connection(self):
+        conn = getattr(self.local, 'connection', None)
+        if conn is None:
+            conn = self.local.connection = self._connect(self.uri)
+        return conn
+    
+    def read_only(self):
+        conn = getattr(self.local, 'read_only', None)
+        if conn is None:
+            conn = self.local.read_only = self._connect(self.read_only_uri)
+            conn.execute('PRAGMA query_only = ON')
+        return conn
+    
+    @contextmanager
+    def transaction(self):
+        """Run the block in a transaction, commit it at the end, or roll it back on errors.
+        
+        A nested transaction is just a part of the outer one.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    
+    def close(self):
+        with self.lock:
+            self.closed = True
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+    
+    def _connect(self, uri):
+        with self.lock:
+            if self.closed:
+                raise sqlite3.ProgrammingError('The database is closed.')
+            # the connections are only used by their own threads, but they are
+            # closed by the thread that closes the database.
+            conn = connect(uri, self.profile_name, uri=True, check_same_thread=False)
+            self.connections.append(conn)
+            return conn
+
+class _Barrier:
+    """A marker in the write queue, it ends the current batch."""
+    def __init__(self, stop=False):
+        self.stop = stop
+        self.done = Future()
+
+class WriteBehindWriter:
+    """A background thread that commits the queued writes in batches.
+
+    Writes are collected until `batch_size` jobs are queued, `flush_interval`
+    seconds have passed since the first job of the batch, or an urgent job is
+    queued, then they are executed in one transaction. The futures are resolved after the commit. If
+    a job fails, only its own future gets the exception, which is also
+    reported on stderr since nobody may wait for that future.
+    """
+    def __init__(self, manager, flush_interval=0.05, batch_size=100):
+        self.manager = manager
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        # the number of the submitted jobs that are not committed yet
+        self.pending = 0
+        self.pending_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, job, urgent=False):
+        future = Future()
+        with self.pending_lock:
+            self.pending += 1
+        self.queue.put((job, future, urgent))
+        return future
+
+    def flush(self):
+        if not self.pending:
+            return
+        barrier = _Barrier()
+        self.queue.put(barrier)
+        barrier.done.result()
+
+    def close(self):
+        barrier = _Barrier(stop=True)
+        self.queue.put(barrier)
+        barrier.done.result()
+        self.thread.join()
+
+    def _run(self):
+        conn = self.manager.connection()
+        stop = False
+        while not stop:
+            batch, barrier = self._collect_batch()
+            if batch:
+                self._write_batch(conn, batch)
+            if barrier:
+                stop = barrier.stop
+                barrier.done.set_result(None)
+
+    def _collect_batch(self):
+        """Return a batch of jobs, and the barrier that ends it (if any)."""
+        item = self.queue.get()
+        if isinstance(item, _Barrier):
+            return [], item
+        batch = [item]
+        if item[2]:
+            return batch, None
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if isinstance(item, _Barrier):
+                return batch, item
+            batch.append(item)
+            if item[2]:
+                break
+        return batch, None
+
+    def _write_batch(self, conn, batch):
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for job, future, _ in batch:
+                # a failed job is rolled back alone, as in the synchronous mode
+                conn.execute('SAVEPOINT job')
+                try:
+                    result = job(conn)
+                except Exception as e:
+                    traceback.print_exc()
+                    conn.execute('ROLLBACK TO job')
+                    conn.execute('RELEASE job')
+                    future.set_exception(e)
+                else:
+                    conn.execute('RELEASE job')
+                    results.append((future, result))
+            conn.commit()
+        except Exception as e:
+            traceback.print_exc()
+            if conn.in_transaction:
+                conn.rollback()
+            self._finished(batch)
+            # the commit failed, none of the jobs is saved
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self._finished(batch)
+            for future, result in results:
+                future.set_result(result)
+
+    def _finished(self, batch):
+        # before the futures are resolved, so a read after `future.result()`
+        # doesn't flush again
+        with self.pending_lock:
+            self.pending -= len(batch)
@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import threading
+import tempfile
+import time
+import unittest
+
+import db
+from model import models
+
+class WriteBehindTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.tmpdir.name, 'test.sqlite3')
+        db.open_database(self.db_name, write_behind=True)
+
+    def tearDown(self) -> None:
+        db.close_database()
+        self.tmpdir.cleanup()
+
+    def insert_session(self, start):
+        sql = 'INSERT INTO session (task, start, end, note) VALUES (?, ?, ?, ?)'
+        return db.submit_commit(sql, (1, start, start + 1500, ''))
+
+    def test_futures_return_row_ids(self):
+        futures = [self.insert_session(i) for i in range(10)]
+        self.assertEqual([f.result() for f in futures], list(range(1, 11)))
+
+    def test_query_sees_submitted_writes(self):
+        for i in range(5):
+            self.insert_session(i)
+        rows = db.execute_query('SELECT count(*) FROM session', ())
+        self.assertEqual(rows[0][0], 5)
+
+    def test_writes_are_grouped_in_batches(self):
+        statements = []
+        def job(conn):
+            conn.set_trace_callback(statements.append)
+            conn.execute('INSERT INTO session (task, start, end) VALUES (1, 0, 0)')
+        db.writer.flush_interval = 1
+        futures = [db.submit(job) for i in range(5)]
+        db.flush()
+        for f in futures:
+            f.result()
+        self.assertEqual(statements.count('COMMIT'), 1)
+        self.assertEqual(db.execute_query('SELECT count(*) FROM session', ())[0][0], 5)
+
+    def test_failed_job_is_rolled_back(self):
+        def job(conn):
+            conn.execute("INSERT INTO task (description) VALUES ('half')")
+            raise ValueError('failed')
+        db.writer.flush_interval = 1
+        good = self.insert_session(1)
+        bad = db.submit(job)
+        db.flush()
+        with self.assertRaises(ValueError):
+            bad.result()
+        self.assertEqual(good.result(), 1)
+        self.assertEqual(db.execute_query('SELECT count(*) FROM task', ())[0][0], 0)
+        self.assertEqual(db.execute_query('SELECT count(*) FROM session', ())[0][0], 1)
+
+    def test_failed_bulk_create_saves_nothing(self):
+        todos = [models.Todo('x'), models.Todo(None)]
+        with self.assertRaises(sqlite3.IntegrityError):
+            models.Todo.bulk_create(todos)
+        self.assertEqual(db.execute_query('SELECT count(*) FROM todo', ())[0][0], 0)
+        self.assertEqual([todo.id for todo in todos], [None, None])
+
+    def test_waited_write_ends_the_batch(self):
+        db.writer.flush_interval = 1
+        begin = time.monotonic()
+        for i in range(3):
+            db.execute_commit('INSERT INTO session (task, start, end) VALUES (1, ?, 0)', (i,))
+        self.assertLess(time.monotonic() - begin, db.writer.flush_interval)
+
+    def test_insert_latency_is_below_flush_interval(self):
+        db.writer.flush_interval = 1
+        begin = time.monotonic()
+        session = models.Session.create(1, 0, 1500, '')
+        self.assertLess(time.monotonic() - begin, db.writer.flush_interval)
+        self.assertEqual(session.id, 1)
+
+    def test_query_without_pending_writes_does_not_flush(self):
+        self.insert_session(1).result()
+        db.writer.flush_interval = 1
+        db.execute_query('SELECT count(*) FROM session', ())
+        self.assertTrue(db.writer.queue.empty())
+        self.assertEqual(db.writer.pending, 0)
+
+    def test_failed_job_does_not_affect_others(self):
+        good = self.insert_session(1)
+        bad = db.submit_commit('INSERT INTO nonexist VALUES (?)', (1,))
+        self.assertEqual(good.result(), 1)
+        with self.assertRaises(Exception):
+            bad.result()
+
+    def test_close_flushes_pending_writes(self):
+        db.writer.flush_interval = 10
+        self.insert_session(1)
+        db.close_database()
+        db.open_database(self.db_name)
+        rows = db.execute_query('SELECT count(*) FROM session', ())
+        self.assertEqual(rows[0][0], 1)
+
+class ProfileTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.tmpdir.name, 'test.sqlite3')
+
+    def tearDown(self) -> None:
+        db.close_database()
+        self.tmpdir.cleanup()
+
+    def test_profile_is_applied(self):
+        db.open_database(self.db_name, profile_name='durable')
+        self.assertEqual(db.db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(db.db.execute('PRAGMA synchronous').fetchone()[0], 2) # FULL
+        self.assertTrue(db.describe_profile().startswith('durable'))
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            db.open_database(self.db_name, profile_name='turbo')
+
+class ConnectionManagerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.tmpdir.name, 'test.sqlite3')
+        db.open_database(self.db_name, write_behind=True)
+
+    def tearDown(self) -> None:
+        db.close_database()
+        self.tmpdir.cleanup()
+
+    def run_in_thread(self, func):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(func()))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_worker_thread_gets_its_own_connection(self):
+        db.execute_commit('INSERT INTO task (description) VALUES (?)', ('task',))
+        def read():
+            rows = db.execute_query('SELECT description FROM task', ())
+            return db.connection(), [row[0] for row in rows]
+        conn, descriptions = self.run_in_thread(read)
+        self.assertIsNot(conn, db.connection())
+        self.assertEqual(descriptions, ['task'])
+
+    def test_read_only_connection(self):
+        def write():
+            try:
+                db.read_only_connection().execute("INSERT INTO task (description) VALUES ('x')")
+            except sqlite3.OperationalError as e:
+                return e
+        self.assertIsInstance(self.run_in_thread(write), sqlite3.OperationalError)
+
+    def test_transaction_rolls_back_on_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            with db.transaction() as conn:
+                conn.execute("INSERT INTO task (description) VALUES ('x')")
+                1/0
+        self.assertEqual(db.execute_query('SELECT count(*) FROM task', ())[0][0], 0)
+
+    def test_close_closes_all_connections(self):
+        conn = self.run_in_thread(db.read_only_connection)
+        db.close_database()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
@@ -0,0 +1,121 @@
+"""Export the tables to CSV or JSON Lines.
+
+The export is a pipeline of generators: the rows are fetched from the
+database a batch at a time (`iter_rows`), encoded to lines (`ENCODERS`) and
+written out one by one, so the memory use doesn't grow with the size of the
+table.
+
+The values are exported as they are stored: times of sessions and todos are
+Unix timestamps, the dates of tasks and schedules are date ordinals. The rows
+are not sorted, so SQLite never builds a temporary sort of the whole table:
+they come in the order of id, or of the date when they are filtered by date,
+and the archived rows follow the rows of the app's database.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+import archive
+import db
+
+class ExportError(Exception):
+    pass
+
+# for each table: the columns, the column for the date filter and its type
+# ('timestamp' or 'ordinal'), and the column for the task filter
+TABLES = {
+    'session': (['id', 'task', 'start', 'end', 'note'], ('start', 'timestamp'), 'task'),
+    'task': (['id', 'description', 'long_session', 'tomato', 'done', 'complete_time',
+        'deadline', 'progress', 'parent'], ('complete_time', 'ordinal'), 'id'),
+    'todo': (['id', 'description', 'create_time', 'deadline', 'done', 'complete_time'],
+        ('create_time', 'timestamp'), None),
+    'repeated_task': (['id', 'title', 'tomato', 'once', 'next_event', 'repeat_year',
+        'repeat_month', 'repeat_day', 'repeat_weekday', 'type', 'done', 'last_gen'],
+        ('next_event', 'ordinal'), None),
+}
+
+FORMATS = ['csv', 'jsonl']
+
+def _day_bound(day, column_type, end=False):
+    """Return the value of `column_type` where a day (an ordinal) begins, or the next day begins if `end`."""
+    if end:
+        day += 1
+    if column_type == 'ordinal':
+        return day
+    return int(datetime.combine(date.fromordinal(day), datetime.min.time()).timestamp())
+
+def build_query(table, first_day=None, last_day=None, task=None):
+    """Return the columns, the SQL and the parameters of the rows to export.
+
+    `first_day` and `last_day` (both included) are date ordinals. The
+    archived sessions and tasks of the range are included.
+    """
+    if table not in TABLES:
+        raise ExportError(f'Unknown table "{table}", choose one of: {", ".join(TABLES)}')
+    columns, (date_column, date_type), task_column = TABLES[table]
+    conditions, parameters = [], []
+    if first_day is not None:
+        conditions.append(f'{date_column} >= ?')
+        parameters.append(_day_bound(first_day, date_type))
+    if last_day is not None:
+        conditions.append(f'{date_column} < ?')
+        parameters.append(_day_bound(last_day, date_type, end=True))
+    if task is not None:
+        if task_column is None:
+            raise ExportError(f'The {table} table can\'t be filtered by task.')
+        conditions.append(f'{task_column} = ?')
+        parameters.append(task)
+
+    source = table
+    if table in archive.COLUMNS:
+        years = None
+        if first_day is not None and last_day is not None:
+            years = archive.years_between(first_day, last_day)
+        source = archive.union_view(db.connection(), table, years)
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+    sql = f'SELECT {", ".join(columns)} FROM {source} {where}'
+    return columns, sql, parameters
+
+def iter_rows(table, first_day=None, last_day=None, task=None, batch_size=1000):
+    """Return the columns of `table`, and an iterator of its rows as plain tuples."""
+    columns, sql, parameters = build_query(table, first_day, last_day, task)
+    return columns, db.iter_query(sql, parameters, batch_size, lambda cursor, row: row)
+
+def encode_csv(columns, rows):
+    """Yield the lines of a CSV file, with a header."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def encode_jsonl(columns, rows):
+    """Yield one JSON object per row."""
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+
+ENCODERS = {
+    'csv': encode_csv,
+    'jsonl': encode_jsonl,
+}
+
+def export(table, out, format='csv', first_day=None, last_day=None, task=None):
+    """Write the rows of `table` to the text stream `out`, return the number of rows."""
+    if format not in ENCODERS:
+        raise ExportError(f'Unknown format "{format}", choose one of: {", ".join(FORMATS)}')
+    columns, rows = iter_rows(table, first_day, last_day, task)
+    count = 0
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+    for chunk in ENCODERS[format](columns, counted(rows)):
+        out.write(chunk)
+    return count
@@ -0,0 +1,102 @@
+import csv
+import io
+import json
+import os
+import sys
+import unittest
+from datetime import date, datetime
+
+import db
+import export
+from model.models import Session, Task, Todo
+
+class ExportTest(unittest.TestCase):
+    def setUp(self) -> None:
+        db.open_database(':memory:')
+        self.task = Task.create(description='Task, "quoted"', tomato=3, parent=None)
+        self.other = Task.create(description='Other', tomato=1, parent=None)
+        self.starts = [int(datetime(2021, 5, day, 10).timestamp()) for day in (1, 2, 3)]
+        for start in self.starts:
+            Session.create(self.task.id, start, start + 1500, f'note\n{start}')
+        Session.create(self.other.id, self.starts[1], self.starts[1] + 1500, '')
+        Todo.create('Buy milk')
+
+    def export(self, table, format='csv', **filters):
+        out = io.StringIO()
+        count = export.export(table, out, format, **filters)
+        return count, out.getvalue()
+
+    def test_csv(self):
+        count, text = self.export('task')
+        rows = list(csv.reader(io.StringIO(text)))
+        self.assertEqual(count, 2)
+        self.assertEqual(rows[0], export.TABLES['task'][0])
+        self.assertEqual(rows[1][:2], [str(self.task.id), 'Task, "quoted"'])
+
+    def test_jsonl(self):
+        count, text = self.export('session', 'jsonl')
+        records = [json.loads(line) for line in text.splitlines()]
+        self.assertEqual(count, 4)
+        self.assertEqual(records[0], {'id': 1, 'task': self.task.id, 'start': self.starts[0],
+            'end': self.starts[0] + 1500, 'note': f'note\n{self.starts[0]}'})
+
+    def test_filters(self):
+        day = date(2021, 5, 2).toordinal()
+        count, text = self.export('session', 'jsonl', first_day=day, last_day=day)
+        self.assertEqual(count, 2)
+        count, text = self.export('session', 'jsonl', first_day=day, task=self.task.id)
+        self.assertEqual([json.loads(line)['start'] for line in text.splitlines()], self.starts[1:])
+        self.assertEqual(self.export('session', last_day=day - 1)[0], 1)
+
+    def test_errors(self):
+        with self.assertRaises(export.ExportError):
+            self.export('sqlite_master')
+        with self.assertRaises(export.ExportError):
+            self.export('session', 'xml')
+        with self.assertRaises(export.ExportError):
+            self.export('todo', task=1)
+
+
+class _MemorySampler:
+    """A text stream that drops the text, and samples the number of allocated memory blocks."""
+    def __init__(self):
+        self.baseline = sys.getallocatedblocks()
+        self.peak = 0
+
+    def write(self, text):
+        self.peak = max(self.peak, sys.getallocatedblocks() - self.baseline)
+
+
+class ExportMemoryTest(unittest.TestCase):
+    """The memory used by an export doesn't depend on the size of the table.
+
+    The large database takes a while to build, set POMODORO_LARGE_TESTS=1 to
+    run the test on it.
+    """
+    def make_database(self, n_rows):
+        db.open_database(':memory:')
+        def job(conn):
+            conn.execute('''
+                WITH RECURSIVE seq(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM seq WHERE i < ?)
+                INSERT INTO repeated_task (title, tomato, once, next_event, repeat_day)
+                SELECT 'schedule ' || i, 2, 0, 738000 + i % 1000, i % 28 + 1 FROM seq''', (n_rows,))
+        db.submit(job)
+
+    def peak_blocks(self, n_rows, format):
+        self.make_database(n_rows)
+        out = _MemorySampler()
+        self.assertEqual(export.export('repeated_task', out, format), n_rows)
+        return out.peak
+
+    def check_flat_memory(self, n_rows):
+        for format in export.FORMATS:
+            small = self.peak_blocks(10000, format)
+            large = self.peak_blocks(n_rows, format)
+            self.assertLess(large, small + 1000, format)
+
+    def test_flat_memory(self):
+        self.check_flat_memory(100000)
+
+    @unittest.skipUnless(os.environ.get('POMODORO_LARGE_TESTS'), 'set POMODORO_LARGE_TESTS=1 to run it')
+    def test_flat_memory_of_millions_of_rows(self):
+        self.check_flat_memory(3000000)
@@ -7,6 +7,7 @@ import datetime
 from asset import AssetPool
 from gui.utils import *
 from .tasklistframe import TaskListFrame
+from .duesoonframe import DueSoonFrame
 from .config import open_config_window
 
 ##
@@ -40,6 +41,7 @@ def render_app_window(app, title="", geom=""):
     asset_pool.add_img('tomato_green', AssetPool.COLOR, 'image/tomato_green.png')
     asset_pool.add_img('tomato_red_small', AssetPool.COLOR, 'image/tomato_red_small.png')
     asset_pool.add_img('tomato_green_small', AssetPool.COLOR, 'image/tomato_green_small.png')
+    asset_pool.add_img('tomato_rotten', AssetPool.COLOR, 'image/tomato-rotten.png')
     asset_pool.add_img('new_icon', AssetPool.COLOR, 'image/plus.png')
     asset_pool.add_img('clock', AssetPool.COLOR, 'image/clock.png')
     asset_pool.add_img('setting', AssetPool.COLOR, 'image/setting.png')
@@ -61,16 +63,15 @@ def render_app_window(app, title="", geom=""):
     
     #        2021-04-01        [#]
     #  -----------------------------
+    #  |     due soon ...          |
     #  |     task list ...         |
     #  |                           |
     
     today_var = tk.StringVar()
-    def set_date():
-        """Update the date every 1 hour."""
-        today = datetime.datetime.today()
+    def set_date(today):
         today_var.set(today.strftime("%Y-%m-%d"))
-        root.after(3600000, set_date)
-    set_date()
+    set_date(datetime.date.today())
+    app.timers.every_midnight(set_date)
     # title bar that show date
     titlebar = ttk.Label(content, textvariable=today_var, anchor=tk.CENTER,
         font=('Monospace', 20), padding=15)
@@ -81,10 +82,11 @@ def render_app_window(app, title="", geom=""):
         
     # task list
     dm = app.dm
+    due_soon_frame = DueSoonFrame(content, dm, app.config.get_due_soon_days(), padx=7)
     task_frame = TaskListFrame(content,
         dm.task_list, dm.todo_task, app.start_session, app.session_running,
         padx=7, pady=3)
-    grid_layout(content, [[titlebar], [task_frame]], start_row=0, padx=15)  
+    grid_layout(content, [[titlebar], [due_soon_frame], [task_frame]], start_row=0, padx=15)  
 
 
 
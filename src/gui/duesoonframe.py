@@ -0,0 +1,58 @@
+import tkinter as tk
+from tkinter import ttk
+from datetime import date
+
+from .utils import subscribe, grid_layout
+from dateutils import format_date
+from model import models
+
+class DueSoonFrame(ttk.Frame):
+    """The unfinished tasks and todos that are overdue or due in the next few days.
+
+    The items are queried by deadline (see `DataManager.due_soon`), the list
+    is refreshed when the task list or the todos change. The frame is empty
+    if nothing is due.
+    """
+    def __init__(self, master, dm, days, **grid_opt):
+        super().__init__(master)
+        self.dm = dm
+        self.days = days
+        self.grid_opt = grid_opt
+        self.columnconfigure(1, weight=1)
+        self.pending_refresh = None
+        subscribe(dm.task_list, 'change', self.schedule_refresh, self)
+        subscribe(dm.task_list, 'add', self.schedule_refresh, self)
+        subscribe(dm.todo_task, 'add', self.schedule_refresh, self)
+        self.refresh()
+
+    # Layout:
+    #
+    # Due soon
+    # task  Write the report   today
+    # todo  Pay the bill       tomorrow
+
+    def schedule_refresh(self, *args):
+        """Refresh when idle, so that the observers are not changed while they are notified,
+        and many changes in a row cause one refresh."""
+        if self.pending_refresh is None:
+            self.pending_refresh = self.after_idle(self.refresh)
+
+    def refresh(self):
+        self.pending_refresh = None
+        for child in self.winfo_children():
+            child.destroy()
+        items = self.dm.due_soon(date.today().toordinal(), self.days)
+        if not items:
+            return
+        rows = [[ttk.Label(self, text="Due soon")]]
+        for item in items:
+            kind = 'todo' if isinstance(item, models.Todo) else 'task'
+            rows.append([
+                ttk.Label(self, text=kind),
+                ttk.Label(self, text=item.description, anchor=tk.W),
+                ttk.Label(self, text=format_date(item.deadline))])
+            topic = 'state-change' if kind == 'todo' else 'task-state-change'
+            # a finished item leaves the list
+            subscribe(item, topic, self.schedule_refresh, rows[-1][0])
+        rows.append([ttk.Separator(self, orient=tk.HORIZONTAL)])
+        grid_layout(self, rows, start_row=0, **self.grid_opt)
@@ -2,7 +2,7 @@ from datetime import datetime
 from tkinter import ttk
 import tkinter as tk
 
-from model.scheduledtask import ScheduledTask
+from model.scheduledtask import PeriodicScheduler, ScheduledTask
 from .simpledialog import Dialog
 from asset import get_asset_pool
 from model import models
@@ -15,8 +15,9 @@ def new_task(master, parent_tasks):
     new_task_dialog = NewTaskDialog(master, "Add Task", parent_tasks)
     new_task = new_task_dialog.result
     if isinstance(new_task, ScheduledTask):
-        today = datetime.today()
-        new_task.last_gen = today.toordinal()
+        today = datetime.today().toordinal()
+        # the schedule starts today, the past days are not caught up
+        new_task.last_gen = today - 1
         new_task.save_to_db(['last_gen'])
         new_task = new_task.get_task_for_date(today)
     return new_task
@@ -106,7 +107,7 @@ class NewTaskDialog(Dialog):
         tomato = self.task_option.get('tomato', self.tomatoes)
         task_type = self.task_option.get('type', self.long_session_var.get())
         onetime_date_spec = self.task_option.get('once', self.date_var.get())
-        repeat_spec = self.task_option.get('repeat', self.repeat_var.get())
+        repeat_spec = self.task_option.get('pattern', self.repeat_var.get())
         deadline_spec = self.task_option.get('deadline', self.deadline_var.get())
         
         today = datetime.today()
@@ -115,15 +116,15 @@ class NewTaskDialog(Dialog):
             # create a ScheduledTask
             onetime_date = (parse_date_spec(onetime_date_spec, today).toordinal()
                 if onetime_date_spec
-                else None)
-            pattern_str = ' '.join(str(i) for i in parse_repeat_pattern(repeat_spec, today))
+                else 0)
+            scheduler = PeriodicScheduler(*parse_repeat_pattern(repeat_spec, today))
             
             self.result = ScheduledTask.create(
                 title=title.capitalize(),
                 tomato = tomato,
                 type=task_type,
                 once=onetime_date,
-                pattern=pattern_str
+                **scheduler.repeat_fields()
             )
         else:
             deadline = (parse_date_spec(deadline_spec, today).toordinal()
@@ -153,6 +154,11 @@ class NewTaskDialog(Dialog):
             self.task_option.get('type', '-') != '.'):
             self.error_var.set("Normal task must specify the number of tomatoes.")
             return False
+        
+        repeat_spec = self.task_option.get('pattern', self.repeat_var.get())
+        if repeat_spec and not parse_repeat_pattern(repeat_spec, datetime.today()):
+            self.error_var.set(f'Invalid repeat pattern "{repeat_spec}".')
+            return False
         self.error_var.set('')
         return True
 
@@ -0,0 +1,94 @@
+import tkinter as tk
+from tkinter import ttk
+from datetime import datetime
+
+from .utils import add_content_frame
+from model import search
+
+class SearchWindow(tk.Toplevel):
+    """Search the session notes, the tasks and the todos.
+
+    The search runs while typing. The results are shown a page at a time,
+    the 'More' button loads the next page.
+    """
+    search_window = None
+    page_size = 50
+    typing_delay = 300 # ms
+
+    def __init__(self, master):
+        super().__init__(master)
+        self.title('Search')
+        self.minsize(width=600, height=400)
+        self.frame = add_content_frame(self, padding=(10, 10, 10, 10))
+        self.last_result = None
+        self.pending_search = None
+        self.render()
+        self.bind('<Escape>', lambda e: self.destroy())
+
+    # Layout:
+    #
+    # [search text             ]
+    # Kind     Time        Text
+    # session  05-10 09:10 ...[report]...
+    # ...
+    #                       [More]
+
+    def render(self):
+        self.query_var = tk.StringVar()
+        entry = ttk.Entry(self.frame, textvariable=self.query_var)
+        entry.grid(row=0, column=0, columnspan=2, sticky='we', pady=(0, 5))
+        entry.bind('<KeyRelease>', self.schedule_search)
+        entry.bind('<Return>', lambda e: self.new_search())
+        entry.focus_set()
+
+        columns = ('time', 'text')
+        self.tree = ttk.Treeview(self.frame, columns=columns)
+        self.tree.heading('#0', text='Kind')
+        self.tree.column('#0', width=70, stretch=False)
+        self.tree.heading('time', text='Time')
+        self.tree.column('time', width=130, anchor='center', stretch=False)
+        self.tree.heading('text', text='Text')
+        self.tree.column('text', stretch=1)
+        self.tree.grid(row=1, column=0, columnspan=2, sticky='wens')
+
+        self.count_label = ttk.Label(self.frame)
+        self.count_label.grid(row=2, column=0, sticky='w')
+        self.more_button = ttk.Button(self.frame, text='More', command=self.show_next_page)
+        self.more_button.grid(row=2, column=1, sticky='e', pady=(5, 0))
+        self.more_button.state(['disabled'])
+
+        self.frame.rowconfigure(1, weight=1)
+        self.frame.columnconfigure(0, weight=1)
+
+    def schedule_search(self, e):
+        "Search when the user stops typing for a moment."
+        if self.pending_search:
+            self.after_cancel(self.pending_search)
+        self.pending_search = self.after(self.typing_delay, self.new_search)
+
+    def new_search(self):
+        if self.pending_search:
+            self.after_cancel(self.pending_search)
+            self.pending_search = None
+        self.tree.delete(*self.tree.get_children())
+        self.last_result = None
+        self.show_next_page()
+
+    def show_next_page(self):
+        results = search.search(self.query_var.get(), self.page_size, self.last_result)
+        for result in results:
+            time = datetime.fromtimestamp(result.time).strftime('%Y-%m-%d %H:%M') if result.time else ''
+            self.tree.insert('', tk.END, text=result.kind, values=(time, result.snippet))
+        if results:
+            self.last_result = results[-1]
+        has_more = len(results) == self.page_size
+        self.more_button.state(['!disabled' if has_more else 'disabled'])
+        count = len(self.tree.get_children())
+        self.count_label.config(text=f'{count}{"+" if has_more else ""} results')
+
+    @classmethod
+    def show_search_window(cls, master):
+        if cls.search_window is None or not tk.Toplevel.winfo_exists(cls.search_window):
+            cls.search_window = cls(master)
+        cls.search_window.transient(master.winfo_toplevel())
+        cls.search_window.lift()
@@ -8,6 +8,7 @@ from .newtaskdialog import new_task
 from .tomatobox import TomatoBox
 from .todowindow import TodoListWindow
 from .sessionhistorywindow import SessionHistoryWindow
+from .searchwindow import SearchWindow
 from model import models
 from model.scheduledtask import ScheduledTask
 
@@ -47,7 +48,7 @@ class TaskListFrame(ttk.Frame):
     def render_header(self):
         
         # Layout: 
-        # [+]  Done  Tasks          Sessions
+        # [+]  Done  Tasks [Search] Sessions
         # ---  ----- -------------  ---------
         
         # newTaskBtn handler
@@ -67,7 +68,12 @@ class TaskListFrame(ttk.Frame):
         newTaskBtn = ttk.Button(self, image=asset_pool.get_image('new_icon'),
             command=add_task)
         done_label = ttk.Label(self, text="Done")
-        title = ttk.Label(self, text = "Task", anchor=tk.CENTER)
+        title = ttk.Frame(self)
+        title.columnconfigure(0, weight=1)
+        ttk.Label(title, text = "Task", anchor=tk.CENTER).grid(row=0, column=0, sticky='we')
+        search_btn = ttk.Button(title, text="Search",
+            command=lambda: SearchWindow.show_search_window(self))
+        search_btn.grid(row=0, column=1)
         session_header = ttk.Label(self, text="Sessions")
         show_sessions_for_today = make_session_history_displayer(self, None)
         session_header.bind('<Button-1>', show_sessions_for_today)
@@ -133,6 +139,10 @@ class TaskListFrame(ttk.Frame):
         on_task_update(task)
         for subtask in task.subtasks:
             rows.extend(self.render_task(subtask, indent+4))
+        if task.subtasks_unloaded:
+            more_btn = ttk.Button(self, text=' '*(indent+4) + 'More subtasks...',
+                command=lambda: self.task_list.load_subtasks(task))
+            rows.append([None, None, more_btn])
         return rows
         
     def render_todo_task(self):
@@ -225,5 +235,7 @@ def make_session_history_displayer(master, task: models.Task = None):
 def get_tomato_list_for_task(w, task):
     get_image = get_asset_pool(w).get_image
     suffix = '' if task.long_session else '_small'
+    # anti procrastination: the remaining tomatoes rot on the deadline day
+    remaining = 'tomato_rotten' if task.is_rotten() else 'tomato_green'+suffix
     return ([get_image('tomato_red'+suffix)]*task.progress + 
-        [get_image('tomato_green'+suffix)]*task.remaining_pomodoro())
\ No newline at end of file
+        [get_image(remaining)]*task.remaining_pomodoro())
\ No newline at end of file
@@ -1,5 +1,5 @@
 import tkinter
-from tkinter.messagebox import askyesno
+from tkinter.messagebox import askyesno, showinfo
 import time
 from datetime import date
 import os
@@ -11,7 +11,9 @@ from gui.help import HelpWindow
 
 from model import appconfig, models
 import audio
+import db
 from datamanager import DataManager
+from timerservice import TimerService
 
 APP_DB = 'app.sqlite3'
 class App:
@@ -19,10 +21,12 @@ class App:
         # data
         self.config = appconfig.PomodoroTimerConfig('config.json')
         first_run = not os.path.exists(db_name)
-        self.dm = DataManager(db_name)
+        self.dm = DataManager(db_name, write_behind=True, profile=self.config.get_db_profile())
+        print(f'Database {db_name}, profile: {db.describe_profile()}')
 
         # gui
         self.window = tkinter.Tk(className='Pomodoro Timer')
+        self.timers = TimerService(self.window.after, self.window.after_cancel)
         self.session_running = tkinter.BooleanVar(value=False)
         render_app_window(self, title, "+700+400")
         self.window.protocol('WM_DELETE_WINDOW', self.on_exit)
@@ -96,18 +100,31 @@ class App:
             warning = "There is a running Pomodoro session, are you sure to close the app?"
             close = askyesno(title="Quit", message=warning)
             if close:
-                self.window.quit()
+                self.quit()
         else:
-            self.window.quit()
+            self.quit()
+
+    def quit(self):
+        self.dm.close()
+        self.window.quit()
 
     def start_cron(self):
-        def reload_task(last_reload_date):
-            today = date.today().toordinal()
-            if today != last_reload_date:
-                self.dm.load_data(today)
-                last_reload_date = today
-            self.window.after(3600000, reload_task, last_reload_date) # 3600000 = 1 hour
-        reload_task(0)
+        "Load the data now, and again when a new day begins."
+        self.load_day(date.today())
+        self.timers.every_midnight(self.load_day)
+
+    def load_day(self, day):
+        backfilled = self.dm.load_data(day.toordinal())
+        if backfilled:
+            self.show_backfilled(backfilled)
+
+    def show_backfilled(self, backfilled, max_lines=10):
+        "Tell the user about the scheduled tasks of the days on which the app didn't run."
+        lines = [f'{date.fromordinal(b.day):%m-%d}  {b.schedule.title}' for b in backfilled[:max_lines]]
+        if len(backfilled) > max_lines:
+            lines.append(f'... and {len(backfilled) - max_lines} more')
+        showinfo(title="Scheduled tasks",
+            message=f"{len(backfilled)} scheduled tasks of the past days are added:\n\n" + '\n'.join(lines))
         
 if __name__ == '__main__':
     import sys, os
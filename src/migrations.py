@@ -0,0 +1,198 @@
+"""Versioned schema migrations.
+
+`pomodoro.sqlite3.sql` is the schema of version 0. The later changes of the
+schema are listed in `MIGRATIONS`: the n-th item (1 based) upgrades the
+database to version n. The version of a database is kept in `PRAGMA
+user_version`.
+
+A migration is a list of steps, each step is either a SQL statement or a
+function that takes the connection. All the steps of a migration are applied
+in one transaction, together with the version change, so a failed migration
+leaves the database untouched.
+"""
+
+# the local day of a session, as the ordinal of the date (see `date.toordinal`).
+# The app's day begins at 1 AM (see `models.start_of_today`), so a session
+# before 1 AM belongs to the previous day.
+SESSION_DAY = "CAST(julianday({start}, 'unixepoch', 'localtime', '-1 hours') - 1721424.5 AS INTEGER)"
+# a week is identified by the ordinal of its Monday
+WEEK_OF_DAY = "({day} - ({day} - 1) % 7)"
+
+def rebuild_session_rollups(conn):
+    """Recalculate the session statistic tables from the `session` table.
+
+    The statistics of the days before the first session of the table are
+    kept, their sessions may be archived (see `archive`).
+    """
+    day = SESSION_DAY.format(start='start')
+    first = conn.execute(f'SELECT {day} FROM session ORDER BY start LIMIT 1').fetchone()
+    if first is None:
+        return
+    first_day = first[0]
+    first_week = WEEK_OF_DAY.format(day=first_day)
+    conn.execute('DELETE FROM session_daily_task WHERE day >= ?', (first_day,))
+    conn.execute('DELETE FROM session_daily WHERE day >= ?', (first_day,))
+    conn.execute(f'DELETE FROM session_weekly WHERE week >= {first_week}')
+    conn.execute(f'''INSERT INTO session_daily_task (day, task, sessions, seconds)
+        SELECT {day}, coalesce(task, 0), count(*), sum(end - start)
+        FROM session GROUP BY 1, 2''')
+    conn.execute('''INSERT INTO session_daily (day, sessions, seconds)
+        SELECT day, sum(sessions), sum(seconds) FROM session_daily_task
+        WHERE day >= ? GROUP BY day''', (first_day,))
+    conn.execute(f'''INSERT INTO session_weekly (week, sessions, seconds)
+        SELECT {WEEK_OF_DAY.format(day='day')}, sum(sessions), sum(seconds)
+        FROM session_daily WHERE day >= {first_week} GROUP BY 1''')
+
+def _rollup_upsert(table, key_columns, key_values):
+    return f'''INSERT INTO {table} ({key_columns}, sessions, seconds)
+            VALUES ({key_values}, 1, NEW.end - NEW.start)
+            ON CONFLICT ({key_columns}) DO UPDATE
+            SET sessions = sessions + 1, seconds = seconds + excluded.seconds;'''
+
+def _session_rollup_trigger():
+    day = SESSION_DAY.format(start='NEW.start')
+    return f'''CREATE TRIGGER session_rollup AFTER INSERT ON session
+        BEGIN
+            {_rollup_upsert('session_daily', 'day', day)}
+            {_rollup_upsert('session_daily_task', 'day, task', day + ', coalesce(NEW.task, 0)')}
+            {_rollup_upsert('session_weekly', 'week', WEEK_OF_DAY.format(day=day))}
+        END'''
+
+def split_repeat_patterns(conn):
+    """Copy the repeat patterns of the schedules, strings of 'year month day
+    weekday', to the integer columns. An invalid pattern means no pattern."""
+    rows = []
+    for schedule_id, pattern in conn.execute('SELECT id, pattern FROM repeated_task'):
+        try:
+            values = [int(v) for v in pattern.split()]
+        except ValueError:
+            values = []
+        if len(values) == 4:
+            rows.append((*values, schedule_id))
+    conn.executemany('''UPDATE repeated_task
+        SET repeat_year = ?, repeat_month = ?, repeat_day = ?, repeat_weekday = ?
+        WHERE id = ?''', rows)
+
+# the type of a repeat pattern, as `PeriodicScheduler.get_type`
+REPEAT_TYPE = """CASE WHEN repeat_weekday <> -1 THEN 'w' WHEN repeat_year <> -1 THEN 'o'
+    WHEN repeat_month <> -1 THEN 'y' WHEN repeat_day <> -1 THEN 'm' END"""
+
+def _fts_index(table, column):
+    """Return the steps that create a full-text index `{table}_fts` of `table.column`.
+
+    The index is an external content FTS5 table: it stores only the index, the
+    text is read from `table`. Triggers keep it in sync with the table.
+    """
+    fts = f'{table}_fts'
+    delete = f"INSERT INTO {fts} ({fts}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});"
+    insert = f"INSERT INTO {fts} (rowid, {column}) VALUES (NEW.id, NEW.{column});"
+    return [
+        f"""CREATE VIRTUAL TABLE {fts} USING fts5({column},
+            content='{table}', content_rowid='id', prefix='2 3')""",
+        f'CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END',
+        f'CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN {delete} END',
+        f"""CREATE TRIGGER {fts}_update AFTER UPDATE OF {column} ON {table}
+            BEGIN {delete} {insert} END""",
+        # index the existing rows
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    ]
+
+MIGRATIONS = [
+    # 1: indexes for the hot queries
+    [
+        # Session.load_session_history_for_today
+        'CREATE INDEX IF NOT EXISTS session_start ON session (start)',
+        # subtasks
+        'CREATE INDEX IF NOT EXISTS task_parent ON task (parent)',
+        # the active schedules that are due
+        'CREATE INDEX IF NOT EXISTS repeated_task_due ON repeated_task (done, next_event)',
+    ],
+    # 2: session statistics per day, per day and task, and per week. They are
+    # kept up to date by a trigger. Sessions are never deleted by the app, the
+    # statistics keep counting a session even if it's deleted (or archived).
+    [
+        '''CREATE TABLE session_daily (
+            day INTEGER PRIMARY KEY,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            seconds INTEGER NOT NULL DEFAULT 0
+        )''',
+        '''CREATE TABLE session_daily_task (
+            day INTEGER NOT NULL,
+            task INTEGER NOT NULL DEFAULT 0,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, task)
+        ) WITHOUT ROWID''',
+        '''CREATE TABLE session_weekly (
+            week INTEGER PRIMARY KEY,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            seconds INTEGER NOT NULL DEFAULT 0
+        )''',
+        _session_rollup_trigger(),
+        rebuild_session_rollups,
+    ],
+    # 3: full-text search of the session notes, and the task and todo
+    # descriptions (see `model.search`)
+    [
+        *_fts_index('session', 'note'),
+        *_fts_index('task', 'description'),
+        *_fts_index('todo', 'description'),
+    ],
+    # 4: the unfinished tasks and todos by deadline (see `models.Deadline`)
+    [
+        'CREATE INDEX IF NOT EXISTS task_due ON task (done, deadline)',
+        'CREATE INDEX IF NOT EXISTS todo_due ON todo (done, deadline)',
+    ],
+    # 5: the active schedules by their one-time day, with `repeated_task_due`
+    # they answer the query of the due schedules (see `ScheduledTask.load_due`)
+    [
+        'CREATE INDEX IF NOT EXISTS repeated_task_once ON repeated_task (done, once)',
+    ],
+    # 6: the repeat pattern of the schedules in integer columns instead of the
+    # `pattern` string, and its type in a generated column (see `ScheduledTask`)
+    [
+        *(f'ALTER TABLE repeated_task ADD COLUMN repeat_{field} INTEGER NOT NULL DEFAULT -1'
+            for field in ['year', 'month', 'day', 'weekday']),
+        split_repeat_patterns,
+        'ALTER TABLE repeated_task DROP COLUMN pattern',
+        f'ALTER TABLE repeated_task ADD COLUMN repeat_type TEXT GENERATED ALWAYS AS ({REPEAT_TYPE}) VIRTUAL',
+    ],
+    # 7: the days of a task's sessions, including the archived ones, so that
+    # only the archives of those years are attached (see `Session.load_sessions_for_task`)
+    [
+        'CREATE INDEX IF NOT EXISTS session_daily_task_task ON session_daily_task (task, day)',
+    ],
+    # 8: the session statistics count a session before 1 AM in the previous
+    # day, as the rest of the app does
+    [
+        'DROP TRIGGER IF EXISTS session_rollup',
+        _session_rollup_trigger(),
+        rebuild_session_rollups,
+    ],
+]
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Apply the migrations that are newer than the database's version.
+
+    Return the list of the applied version numbers.
+    """
+    version = schema_version(conn)
+    applied = []
+    for number, steps in enumerate(migrations[version:], version + 1):
+        conn.execute('BEGIN')
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {number}')
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        applied.append(number)
+    return applied
@@ -0,0 +1,70 @@
+import sqlite3
+import unittest
+
+import migrations
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conn = sqlite3.connect(':memory:')
+        with open('pomodoro.sqlite3.sql') as f:
+            self.conn.executescript(f.read())
+
+    def tearDown(self) -> None:
+        self.conn.close()
+
+    def query_plan(self, sql, parameters):
+        rows = self.conn.execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+        return ' '.join(row[-1] for row in rows)
+
+    def test_migrate_to_latest_version(self):
+        applied = migrations.migrate(self.conn)
+        self.assertEqual(applied, list(range(1, len(migrations.MIGRATIONS) + 1)))
+        self.assertEqual(migrations.schema_version(self.conn), len(migrations.MIGRATIONS))
+        self.assertEqual(migrations.migrate(self.conn), [])
+
+    def test_failed_migration_is_rolled_back(self):
+        bad_migrations = [
+            ['CREATE TABLE first (id INTEGER)'],
+            ['CREATE TABLE second (id INTEGER)', 'INSERT INTO nonexist VALUES (1)'],
+        ]
+        with self.assertRaises(sqlite3.OperationalError):
+            migrations.migrate(self.conn, bad_migrations)
+        self.assertEqual(migrations.schema_version(self.conn), 1)
+        tables = [row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        self.assertIn('first', tables)
+        self.assertNotIn('second', tables)
+
+    def test_hot_queries_use_indexes(self):
+        queries = [
+            ('SELECT t.description, s.start FROM session as s, task as t WHERE s.start > ? AND s.task = t.id',
+                (0,), 'session_start'),
+            ('SELECT * FROM task WHERE parent = ?', (1,), 'task_parent'),
+            ('SELECT * FROM repeated_task WHERE done = ? AND next_event <= ?', (0, 1), 'repeated_task_due'),
+            ('SELECT * FROM task WHERE deadline >= ? AND deadline < ? AND done = ? ORDER BY deadline, id',
+                (1, 2, 0), 'task_due'),
+            ('SELECT * FROM todo WHERE deadline > ? AND deadline < ? AND done = ? ORDER BY deadline, id',
+                (0, 2, 0), 'todo_due'),
+            ('SELECT * FROM repeated_task WHERE done = ? AND once <= ?', (0, 1), 'repeated_task_once'),
+        ]
+        before = [self.query_plan(sql, parameters) for sql, parameters, _ in queries]
+        migrations.migrate(self.conn)
+        after = [self.query_plan(sql, parameters) for sql, parameters, _ in queries]
+        for (sql, _, index), plan_before, plan_after in zip(queries, before, after):
+            self.assertNotIn(index, plan_before, sql)
+            self.assertIn(f'USING INDEX {index}', plan_after, sql)
+
+    def test_days_of_a_task_use_index(self):
+        migrations.migrate(self.conn)
+        plan = self.query_plan('SELECT min(day), max(day) FROM session_daily_task WHERE task = ?', (1,))
+        self.assertIn('USING COVERING INDEX session_daily_task_task', plan)
+
+    def test_repeat_patterns_are_split(self):
+        migrations.migrate(self.conn, migrations.MIGRATIONS[:5])
+        self.conn.executemany('INSERT INTO repeated_task (title, tomato, once, pattern) VALUES (?, 1, 0, ?)',
+            [('weekly', '-1 -1 -1 4'), ('yearly', '-1 5 15 -1'), ('once', ''), ('bad', 'every day')])
+        self.conn.commit()
+        migrations.migrate(self.conn)
+        rows = self.conn.execute('''SELECT title, repeat_year, repeat_month, repeat_day, repeat_weekday, repeat_type
+            FROM repeated_task ORDER BY id''').fetchall()
+        self.assertEqual(rows, [('weekly', -1, -1, -1, 4, 'w'), ('yearly', -1, 5, 15, -1, 'y'),
+            ('once', -1, -1, -1, -1, None), ('bad', -1, -1, -1, -1, None)])
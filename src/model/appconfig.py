@@ -14,9 +14,15 @@ class PomodoroTimerConfig(jsonconfig.JsonBasedConfig):
         return self.get_config(['appearance', 'minimal_progress_window'])
     def get_main_window_on_top(self):
         return self.get_config(['appearance', 'main_window_on_top'])
+    def get_due_soon_days(self):
+        return self.get_config(['appearance', 'due_soon_days'])
     def show_note_editor(self):
         return self.get_config(['notification', 'show_note_editor'])
     def use_audio_alert(self):
         return self.get_config(['notification', 'use_audio'])
     def get_audio_file(self):
-        return self.get_config(['notification', 'audio_file'])
\ No newline at end of file
+        return self.get_config(['notification', 'audio_file'])
+    def get_db_profile(self):
+        return self.get_config(['database', 'profile'])
+    def get_archive_after_days(self):
+        return self.get_config(['database', 'archive_after_days'])
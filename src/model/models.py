@@ -1,17 +1,48 @@
 from dataclasses import dataclass, field
 from tkinter.constants import S
 from typing import ClassVar, List, Set
-from datetime import datetime
+from collections import Counter, OrderedDict
+from datetime import datetime, date
 import time
 # import re
-from collections import Counter
 
 from .observable import Observable
 from .noorm import Model
-# import db
+import archive
+import db
+from dateutils import day_start
+import migrations
+
+# the number of levels of subtasks that are loaded with the task list
+TREE_DEPTH = 8
+
+class Deadline:
+    """Queries of the unfinished entities by deadline, for the models that have `deadline` and `done`.
+    
+    A deadline is a day ordinal, 0 or NULL means no deadline. The queries are
+    answered by the (done, deadline) indexes.
+    """
+    @classmethod
+    def due_within(cls, days, today=None):
+        """Return the unfinished entities that are due in the next `days` days (today included), by deadline."""
+        today = today or date.today().toordinal()
+        return cls.query_db({'deadline >=': today, 'deadline <': today + days},
+            order_by=['deadline', 'id'], done=0)
+    
+    @classmethod
+    def overdue(cls, today=None):
+        """Return the unfinished entities whose deadline has passed, by deadline."""
+        today = today or date.today().toordinal()
+        return cls.query_db({'deadline >': 0, 'deadline <': today},
+            order_by=['deadline', 'id'], done=0)
+    
+    def is_rotten(self, today=None):
+        """Is it unfinished on or after its deadline day?"""
+        today = today or date.today().toordinal()
+        return not self.done and bool(self.deadline) and self.deadline <= today
 
 @dataclass
-class Task(Observable, Model):
+class Task(Observable, Model, Deadline):
     """A single task entry."""
     _fields = {
         'description': str,
@@ -28,7 +59,13 @@ class Task(Observable, Model):
     _showing_sessions = False 
     _topics: ClassVar[Set[str]] = set(['task-state-change'])
     subtasks: List = field(default_factory=list, init=False, hash=False)
+    # the task has unfinished subtasks that are not loaded, see `load_tree`
+    subtasks_unloaded: bool = field(default=False, init=False, hash=False)
     
+    def _on_load(self):
+        self.subtasks = []
+        self.subtasks_unloaded = False
+        
     def remaining_pomodoro(self):
         return self.tomato - self.progress
         
@@ -40,24 +77,103 @@ class Task(Observable, Model):
         return self.remaining_pomodoro() > 0 and not self.done
         
     def set_done(self, flag):
-        self.done = flag
-        self.complete_time = ( datetime.today().toordinal()
+        """Change the done state of the task. A done task makes all its subtasks done too."""
+        tasks = [self, *self.descendants()] if flag else [self]
+        if flag:
+            # the subtasks that are not loaded are finished too
+            for task in [task for task in tasks if task.subtasks_unloaded]:
+                tasks.extend(Task.load_tree(task.id, max_depth=None))
+        complete_time = ( datetime.today().toordinal()
             if flag
             else None)
-        self.save_to_db(['done', 'complete_time'])
-        if flag:
-            for task in self.subtasks:
-                task.set_done(flag)
-        self.notify('task-state-change', self)
+        for task in tasks:
+            task.done = flag
+            task.complete_time = complete_time
+        Task.bulk_save(tasks, ['done', 'complete_time'])
+        for task in reversed(tasks):
+            task.notify('task-state-change', task)
+    
+    def descendants(self):
+        for task in self.subtasks:
+            yield task
+            yield from task.descendants()
         
     @classmethod
     def load_list(cls, where=None, **kw):
         tasks = cls.query_db(where, **kw)
-        sessions = Session.load_session_count_of_today()
+        sessions = Session.count_today_by_task()
         for task in tasks:
             task.progress = sessions.get(task.id, 0)
         return tasks
 
+    @classmethod
+    def load_tree(cls, parent=None, max_depth=TREE_DEPTH):
+        """Load the unfinished tasks of a hierarchy in one query, the parents before their subtasks.
+
+        Without `parent`, the tree of all the tasks is loaded: the top-level
+        tasks are the ones whose parent is done or doesn't exist, and the
+        task of the smallest id of each loop of parents (which an import or a
+        manual edit may make) that no top-level task leads to. Otherwise the
+        subtasks of `parent` are loaded, at any depth.
+
+        The tasks are ordered by depth, then by id. The subtasks deeper than
+        `max_depth` levels (None: no limit) are not loaded, their parents
+        have `subtasks_unloaded` set, see `TaskList.load_subtasks`. A loop of
+        parents is followed only once round.
+        """
+        def build():
+            columns = ', '.join(f'task.{f}' for f in cls._fields)
+            if parent is None:
+                # `up(start, id)`: the ancestors of the tasks, walked only
+                # through larger ids, so a task that meets itself is the
+                # smallest id of its loop
+                loops = '''up(start, id) AS (
+                    SELECT id, parent FROM task WHERE done = 0 AND parent > id
+                    UNION
+                    SELECT up.start, task.parent FROM up JOIN task ON task.id = up.id
+                    WHERE task.done = 0 AND task.id > up.start),'''
+                roots = '''done = 0 AND description <> '' AND (NOT EXISTS (
+                    SELECT 1 FROM task AS p WHERE p.id = task.parent AND p.done = 0)
+                    OR id IN (SELECT start FROM up WHERE id = start))'''
+                root_path = "'/'"
+            else:
+                loops = ''
+                roots = 'done = 0 AND parent = :parent'
+                root_path = "'/' || :parent || '/'"
+            # `+c.done` keeps SQLite on the (parent) index, the (done, deadline) index would scan all the tasks
+            depth_limit = '' if max_depth is None else 'AND tree.depth < :max_depth'
+            unloaded = '0' if max_depth is None else '''tree.depth = :max_depth AND EXISTS (
+                SELECT 1 FROM task AS c WHERE c.parent = task.id AND +c.done = 0)'''
+            # `path` has the ids of the ancestors, '/1/2/', a task that is
+            # already on the path closes a loop
+            return f'''WITH RECURSIVE {loops} tree(id, depth, path) AS (
+                    SELECT id, 0, {root_path} || id || '/' FROM task WHERE {roots}
+                    UNION ALL
+                    SELECT task.id, tree.depth + 1, tree.path || task.id || '/'
+                    FROM task JOIN tree ON task.parent = tree.id
+                    WHERE task.done = 0 AND instr(tree.path, '/' || task.id || '/') = 0 {depth_limit})
+                SELECT {columns}, {unloaded} AS subtasks_unloaded
+                FROM tree JOIN task ON task.id = tree.id
+                ORDER BY tree.depth, task.id'''
+        sql = cls._cached_sql(('load_tree', parent is None, max_depth is None), build)
+        rows = cls.execute_query(sql, dict(parent=parent, max_depth=max_depth))
+        tasks = cls._materialize(rows)
+        sessions = Session.count_today_by_task()
+        for task, row in zip(tasks, rows):
+            task.progress = sessions.get(task.id, 0)
+            task.subtasks_unloaded = bool(row['subtasks_unloaded'])
+        return tasks
+
+    @classmethod
+    def get_description(cls, task_id):
+        """Return the description of a task, or None if there is no such task."""
+        identity_map = db.get_identity_map()
+        task = identity_map.get((cls._table_name, task_id)) if identity_map is not None else None
+        if task is not None:
+            return task.description
+        rows = cls.execute_query("SELECT description FROM task WHERE id = ?", (task_id,))
+        return rows[0][0] if rows else None
+
     @classmethod
     def get_or_create_todo_task(cls):
         todo_data = cls.query_db(description='')
@@ -71,26 +187,64 @@ class Task(Observable, Model):
         self.tomato=0
         
 class TaskList(Observable):
-    """TaskList keeps the tasks in a parent-child hierarchy."""
+    """TaskList keeps the tasks in a parent-child hierarchy.
+    
+    `tasks` has the top-level tasks, and `index` all the tasks of the list,
+    by id. A task whose parent is not in the list (it's done, or not loaded)
+    is a top-level task.
+    """
     _topics = ['change', 'add']
     def __init__(self):
         self.tasks = {}
+        self.index = {}
         
     def set_task_list(self, task_list):
-        for task in sorted(task_list, key=lambda task: task.id):
-            self.add(task, False)
+        """Build the hierarchy of the tasks, of any depth, in any order."""
+        self.tasks = {}
+        self.index = {task.id: task for task in task_list}
+        for task in task_list:
+            task.subtasks = []
+        for task in task_list:
+            self._attach(task)
         self.notify('change', self)
         
     def __iter__(self):
         return iter(self.tasks.values())
         
     def add(self, task, notify=True):
-        if task.parent is None:
-            self.tasks[task.id] = task
-        else:
-            self.tasks[task.parent].subtasks.append(task)
+        self.index[task.id] = task
+        self._attach(task)
         if notify:
             self.notify('change', self)
+    
+    def load_subtasks(self, task, max_depth=TREE_DEPTH):
+        """Load the subtasks of a task whose subtasks are not loaded (see `Task.load_tree`)."""
+        subtasks = Task.load_tree(task.id, max_depth)
+        task.subtasks = []
+        task.subtasks_unloaded = False
+        for subtask in subtasks:
+            subtask.subtasks = []
+            self.index[subtask.id] = subtask
+        for subtask in subtasks:
+            self._attach(subtask)
+        self.notify('change', self)
+    
+    def _attach(self, task):
+        parent = self.index.get(task.parent) if task.parent else None
+        if parent is None or self._closes_loop(task, parent):
+            self.tasks[task.id] = task
+        else:
+            parent.subtasks.append(task)
+    
+    def _closes_loop(self, task, parent):
+        """Whether `task` is an ancestor of `parent`, the first task attached of a loop of parents is a top-level task."""
+        seen = set()
+        while parent is not None and parent.id not in self.tasks and parent.id not in seen:
+            if parent is task:
+                return True
+            seen.add(parent.id)
+            parent = self.index.get(parent.parent) if parent.parent else None
+        return False
         
 class TodoTask(Task):
     _topics: ClassVar[Set[str]] = set(['change', 'add', 'task-state-change'])
@@ -133,7 +287,7 @@ class TodoTask(Task):
         self.todos = Todo.load_list(done=0)
         self.notify('task-state-change', self)
         
-class Todo(Model, Observable):
+class Todo(Model, Observable, Deadline):
     _fields = {
         'description': str,
         'deadline': int,
@@ -170,39 +324,182 @@ class Session(Model):
         'task': int
     }
 
-    def __init__(self, task, start, end, note):
+    def __init__(self, task, start, end, note, id=None):
         self.task = task
         self.start = start
         self.end = end
         self.note = note
+        self.id = id
+        
+    def save_to_db(self, fields=[]):
+        super().save_to_db(fields)
+        history_cache.update(self)
+        
+    def delete_from_db(self):
+        super().delete_from_db()
+        history_cache.remove(self)
         
     @classmethod
     def load_sessions_for_task(cls, task_id):
-        def _format_task_session(session):
-            start, end, note = session
-            time_format = "%Y-%m-%d %H:%M"
-            return timestamp_to_string(start, time_format), timestamp_to_string(end, time_format), note
-        rows = cls.query_db_fields(['start', 'end', 'note'], task=task_id)
-        return [_format_task_session(row) for row in rows]
+        """Return the formatted (start, end, note) of the task's sessions."""
+        return history_cache.get_task(task_id, lambda: cls._load_sessions_for_task(task_id))
+    
+    @classmethod
+    def _load_sessions_for_task(cls, task_id):
+        """Return a dict of {session id: formatted row} of the task."""
+        # the task's sessions may be archived, only the years between its
+        # first and last session days (from the statistics, which keep the
+        # archived sessions) are attached. One more day is included, in case
+        # the statistics day of a session is not its calendar day.
+        first_day, last_day = cls.execute_query(
+            "SELECT min(day), max(day) FROM session_daily_task WHERE task = ?", (task_id,))[0]
+        years = archive.years_between(first_day, last_day + 1) if first_day is not None else []
+        table = archive.union_view(db.connection(), 'session', years)
+        sql = f"SELECT id, start, end, note FROM {table} WHERE task = ? ORDER BY start"
+        return {row[0]: _format_task_session(*row[1:]) for row in cls.execute_query(sql, (task_id,))}
     
     @classmethod
     def load_session_history_for_today(cls):
-        def _format_daily_session(session):
-            task, start, end, note = session
-            time_format = "%H:%M"
-            return timestamp_to_string(start, time_format), timestamp_to_string(end, time_format), str(task) or "Misc. todos", note
-        
-        today = datetime.today()
-        start_of_today = datetime(today.year, today.month, today.day, 1, 0, 0).timestamp()
-        sql = """SELECT t.description, s.start, s.end, s.note 
+        """Return the formatted (start, end, task, note) of today's sessions."""
+        return history_cache.get_today(cls._load_session_history_for_today)
+    
+    @classmethod
+    def _load_session_history_for_today(cls, day_start):
+        """Return a dict of {session id: formatted row} of the sessions since `day_start`."""
+        sql = """SELECT s.id, t.description, s.start, s.end, s.note 
                 FROM session as s, task as t 
-                WHERE s.start > ? AND s.task = t.id"""
-        sessions = Session.execute_query(sql, (start_of_today,))
-        return [_format_daily_session(s) for s in sessions]
+                WHERE s.start > ? AND s.task = t.id
+                ORDER BY s.start"""
+        sessions = Session.execute_query(sql, (day_start,))
+        return {s[0]: _format_daily_session(*s[1:]) for s in sessions}
+    
+    @classmethod
+    def count_today_by_task(cls):
+        """Return a dict of {task id: number of sessions} of today."""
+        # `+task`: grouping by the (task) index would scan all the sessions,
+        # the (start) index only reads today's
+        sql = "SELECT task, count(*) FROM session WHERE start > ? GROUP BY +task"
+        return dict(cls.execute_query(sql, (start_of_today(),)))
+    
+    # Statistics. The ranges are given in day ordinals (both ends are
+    # included), the results are read from the rollup tables, which are
+    # updated whenever a session is created.
+    
+    @classmethod
+    def daily_statistics(cls, first_day, last_day):
+        """Return a list of (day, sessions, seconds) for the days that have sessions."""
+        sql = """SELECT day, sessions, seconds FROM session_daily
+                WHERE day BETWEEN ? AND ? ORDER BY day"""
+        return [tuple(row) for row in cls.execute_query(sql, (first_day, last_day))]
+    
+    @classmethod
+    def weekly_statistics(cls, first_day, last_day):
+        """Return a list of ((iso year, iso week), sessions, seconds) for the weeks in the range."""
+        sql = """SELECT week, sessions, seconds FROM session_weekly
+                WHERE week BETWEEN ? AND ? ORDER BY week"""
+        first_week = first_day - (first_day - 1) % 7
+        rows = cls.execute_query(sql, (first_week, last_day))
+        return [(date.fromordinal(week).isocalendar()[:2], sessions, seconds)
+            for week, sessions, seconds in rows]
+    
+    @classmethod
+    def task_statistics(cls, first_day, last_day):
+        """Return a dict of {task id: (sessions, seconds)} in the range."""
+        sql = """SELECT task, sum(sessions), sum(seconds) FROM session_daily_task
+                WHERE day BETWEEN ? AND ? GROUP BY task"""
+        rows = cls.execute_query(sql, (first_day, last_day))
+        return {task: (sessions, seconds) for task, sessions, seconds in rows}
     
     @classmethod
-    def load_session_count_of_today(cls):
-        return Counter(s[0] for s in cls.load_session_history_for_today())
+    def rebuild_statistics(cls):
+        """Recalculate all the statistics from the sessions."""
+        db.submit(migrations.rebuild_session_rollups, urgent=True).result()
+        
+class SessionHistoryCache:
+    """The formatted session history of today, and of the recently viewed tasks.
+    
+    An entry is a dict of {session id: formatted row}, so a new session or a
+    changed note updates the entries in place (see `Session.save_to_db`).
+    At most `max_tasks` tasks are kept, the least recently viewed one is
+    dropped first. The cache is used by the GUI thread only, and it's
+    emptied when another database is opened.
+    """
+    def __init__(self, max_tasks=32):
+        self.max_tasks = max_tasks
+        self.stats = Counter()
+        self.clear()
+        
+    def clear(self):
+        self.manager = db.manager
+        self.day_start = None
+        self.today = None
+        self.tasks = OrderedDict()
         
+    def _check_database(self):
+        if self.manager is not db.manager:
+            self.clear()
+        
+    def get_today(self, load):
+        """Return today's rows, `load(day_start)` them if they are not cached."""
+        self._check_database()
+        day_start = start_of_today()
+        if self.today is None or self.day_start != day_start:
+            self.stats['misses'] += 1
+            self.today = load(day_start)
+            self.day_start = day_start
+        else:
+            self.stats['hits'] += 1
+        return list(self.today.values())
+    
+    def get_task(self, task_id, load):
+        """Return the rows of the task, `load()` them if they are not cached."""
+        self._check_database()
+        rows = self.tasks.get(task_id)
+        if rows is None:
+            self.stats['misses'] += 1
+            rows = self.tasks[task_id] = load()
+            if len(self.tasks) > self.max_tasks:
+                self.tasks.popitem(last=False)
+        else:
+            self.stats['hits'] += 1
+            self.tasks.move_to_end(task_id)
+        return list(rows.values())
+    
+    def update(self, session):
+        """Add or replace the rows of a saved session."""
+        self._check_database()
+        if self.today is not None and session.start > self.day_start:
+            if session.id in self.today:
+                description = self.today[session.id][2]
+            else:
+                description = Task.get_description(session.task)
+            if description is not None:
+                self.today[session.id] = _format_daily_session(
+                    description, session.start, session.end, session.note)
+        rows = self.tasks.get(session.task)
+        if rows is not None:
+            rows[session.id] = _format_task_session(session.start, session.end, session.note)
+            
+    def remove(self, session):
+        self._check_database()
+        if self.today is not None:
+            self.today.pop(session.id, None)
+        for rows in self.tasks.values():
+            rows.pop(session.id, None)
+
+history_cache = SessionHistoryCache()
+
+def _format_task_session(start, end, note):
+    time_format = "%Y-%m-%d %H:%M"
+    return timestamp_to_string(start, time_format), timestamp_to_string(end, time_format), note
+
+def _format_daily_session(description, start, end, note):
+    time_format = "%H:%M"
+    return timestamp_to_string(start, time_format), timestamp_to_string(end, time_format), str(description) or "Misc. todos", note
+
+def start_of_today():
+    "Return the timestamp of the start of today (1:00 AM)."
+    return day_start(date.today().toordinal())
+
 def timestamp_to_string(timestamp, time_format):
     return datetime.fromtimestamp(timestamp).strftime(time_format)
@@ -0,0 +1,183 @@
+import unittest
+from datetime import date, datetime
+
+import db
+from .models import Session, Task, TaskList, history_cache, start_of_today
+
+class SessionTest(unittest.TestCase):
+    def setUp(self) -> None:
+        db.open_database(':memory:')
+        self.task1 = Task.create(description='Task 1', tomato=3, parent=None)
+        self.task2 = Task.create(description='Task 2', tomato=3, parent=None)
+        today = int(start_of_today()) + 60
+        yesterday = today - 86400
+        for task, start in [(self.task1, today), (self.task1, today + 1800),
+                (self.task2, today), (self.task2, yesterday)]:
+            Session.create(task.id, start, start + 1500, '')
+
+    def test_count_today_by_task(self):
+        self.assertEqual(Session.count_today_by_task(), {self.task1.id: 2, self.task2.id: 1})
+
+    def test_count_today_by_task_reads_only_today(self):
+        statements = []
+        db.connection().set_trace_callback(statements.append)
+        try:
+            Session.count_today_by_task()
+        finally:
+            db.connection().set_trace_callback(None)
+        sql, = statements
+        plan = db.connection().execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+        self.assertIn('SEARCH session USING INDEX session_start', ' '.join(row[-1] for row in plan))
+
+    def test_load_list_sets_progress(self):
+        tasks = Task.load_list(done=0)
+        self.assertEqual([task.progress for task in tasks], [2, 1])
+
+
+class TaskTreeTest(unittest.TestCase):
+    def setUp(self) -> None:
+        db.open_database(':memory:')
+        def create(description, parent=None, done=False):
+            return Task.create(description=description, tomato=1, parent=parent, done=done)
+        # the subtasks are created before their parents, to check the order
+        self.child = create('Child')
+        self.grandchild = create('Grandchild')
+        self.root = create('Root')
+        self.done = create('Done', done=True)
+        self.orphan = create('Orphan')
+        for task, parent in [(self.child, self.root.id), (self.grandchild, self.child.id),
+                (self.orphan, self.done.id), (self.root, 999)]:
+            task.parent = parent
+            task.save_to_db(['parent'])
+        self.task_list = TaskList()
+
+    def tree(self, tasks):
+        return [(task.description, self.tree(task.subtasks)) for task in tasks]
+
+    def test_load_tree_builds_hierarchy(self):
+        tasks = Task.load_tree()
+        self.assertEqual([task.description for task in tasks], ['Root', 'Orphan', 'Child', 'Grandchild'])
+        self.task_list.set_task_list(tasks)
+        self.assertEqual(self.tree(self.task_list),
+            [('Root', [('Child', [('Grandchild', [])])]), ('Orphan', [])])
+        self.assertEqual(len(self.task_list.index), 4)
+
+    def test_deep_subtasks_are_loaded_lazily(self):
+        self.task_list.set_task_list(Task.load_tree(max_depth=1))
+        child = self.task_list.index[self.child.id]
+        self.assertTrue(child.subtasks_unloaded)
+        self.assertEqual(child.subtasks, [])
+        self.task_list.load_subtasks(child)
+        self.assertFalse(child.subtasks_unloaded)
+        self.assertEqual(self.tree(child.subtasks), [('Grandchild', [])])
+
+    def test_set_done_finishes_unloaded_subtasks(self):
+        self.task_list.set_task_list(Task.load_tree(max_depth=0))
+        self.task_list.index[self.root.id].set_done(True)
+        self.assertEqual([task.description for task in Task.load_tree()], ['Orphan'])
+
+    def test_loop_of_parents_ends(self):
+        # Root -> Child -> Grandchild -> Root
+        self.root.parent = self.grandchild.id
+        self.root.save_to_db(['parent'])
+        subtasks = Task.load_tree(self.root.id, max_depth=None)
+        self.assertEqual([task.description for task in subtasks], ['Child', 'Grandchild'])
+        # the loop has no top-level task, its smallest id is shown as one
+        tasks = Task.load_tree()
+        self.assertEqual([task.description for task in tasks], ['Child', 'Orphan', 'Grandchild', 'Root'])
+        self.task_list.set_task_list(tasks)
+        self.assertEqual(self.tree(self.task_list),
+            [('Child', [('Grandchild', [('Root', [])])]), ('Orphan', [])])
+
+    def test_add_subtask_of_unknown_parent(self):
+        self.task_list.add(Task(description='New', tomato=1, parent=12345, id=100))
+        self.task_list.add(Task(description='Sub', tomato=1, parent=100, id=101))
+        self.assertEqual(self.tree(self.task_list), [('New', [('Sub', [])])])
+
+
+class SessionStatisticsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        db.open_database(':memory:')
+        # Monday 2021-05-10 ... Sunday 2021-05-16, and Monday 2021-05-17
+        self.days = [date(2021, 5, d) for d in (10, 12, 12, 16, 17)]
+        for i, day in enumerate(self.days):
+            start = int(datetime(day.year, day.month, day.day, 23, 30).timestamp())
+            Session.create(i % 2 + 1, start, start + 1500, '')
+        self.first = date(2021, 5, 1).toordinal()
+        self.last = date(2021, 5, 31).toordinal()
+
+    def test_daily_statistics(self):
+        stats = Session.daily_statistics(self.first, self.last)
+        expected = [(date(2021, 5, d).toordinal(), n, n * 1500) for d, n in [(10, 1), (12, 2), (16, 1), (17, 1)]]
+        self.assertEqual(stats, expected)
+
+    def test_session_before_1am_is_counted_in_the_previous_day(self):
+        start = int(datetime(2021, 5, 20, 0, 30).timestamp())
+        Session.create(1, start, start + 1500, '')
+        stats = Session.daily_statistics(date(2021, 5, 19).toordinal(), date(2021, 5, 20).toordinal())
+        self.assertEqual(stats, [(date(2021, 5, 19).toordinal(), 1, 1500)])
+
+    def test_weekly_statistics(self):
+        stats = Session.weekly_statistics(date(2021, 5, 12).toordinal(), self.last)
+        self.assertEqual(stats, [((2021, 19), 4, 6000), ((2021, 20), 1, 1500)])
+
+    def test_task_statistics(self):
+        stats = Session.task_statistics(self.first, date(2021, 5, 12).toordinal())
+        self.assertEqual(stats, {1: (2, 3000), 2: (1, 1500)})
+
+    def test_rebuild_statistics(self):
+        before = Session.daily_statistics(self.first, self.last)
+        db.db.execute('DELETE FROM session_daily')
+        db.db.commit()
+        Session.rebuild_statistics()
+        self.assertEqual(Session.daily_statistics(self.first, self.last), before)
+        self.assertEqual(len(Session.weekly_statistics(self.first, self.last)), 2)
+
+
+class SessionHistoryCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        db.open_database(':memory:')
+        self.task = Task.create(description='Task 1', tomato=3, parent=None)
+        self.start = int(start_of_today()) + 60
+        self.session = Session.create(self.task.id, self.start, self.start + 1500, 'first')
+        self.stats = history_cache.stats
+        self.stats.clear()
+
+    def test_repeated_loads_are_cached(self):
+        today = Session.load_session_history_for_today()
+        self.assertEqual([row[2:] for row in today], [('Task 1', 'first')])
+        self.assertEqual(Session.load_session_history_for_today(), today)
+        sessions = Session.load_sessions_for_task(self.task.id)
+        self.assertEqual(Session.load_sessions_for_task(self.task.id), sessions)
+        self.assertEqual(self.stats, {'misses': 2, 'hits': 2})
+
+    def test_new_session_and_note_change_update_the_cache(self):
+        Session.load_session_history_for_today()
+        Session.load_sessions_for_task(self.task.id)
+        Session.create(self.task.id, self.start + 1800, self.start + 3300, 'second')
+        self.session.note = 'changed'
+        self.session.save_to_db(['note'])
+        today = Session.load_session_history_for_today()
+        sessions = Session.load_sessions_for_task(self.task.id)
+        self.assertEqual(self.stats['misses'], 2)
+        self.assertEqual([row[-1] for row in today], ['changed', 'second'])
+        self.assertEqual([row[-1] for row in sessions], ['changed', 'second'])
+        history_cache.clear()
+        self.assertEqual(Session.load_session_history_for_today(), today)
+        self.assertEqual(Session.load_sessions_for_task(self.task.id), sessions)
+
+    def test_least_recently_viewed_task_is_dropped(self):
+        tasks = [Task.create(description=f'Task {i}', tomato=1, parent=None) for i in range(3)]
+        history_cache.max_tasks = 2
+        try:
+            for task in tasks + tasks[1:]:
+                Session.load_sessions_for_task(task.id)
+            self.assertEqual(list(history_cache.tasks), [tasks[1].id, tasks[2].id])
+            self.assertEqual(self.stats, {'misses': 3, 'hits': 2})
+        finally:
+            history_cache.max_tasks = 32
+
+    def test_cache_is_emptied_for_another_database(self):
+        Session.load_sessions_for_task(self.task.id)
+        db.open_database(':memory:')
+        self.assertEqual(Session.load_sessions_for_task(self.task.id), [])
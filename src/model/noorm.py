@@ -17,17 +17,39 @@ Method defined in Model class:
 * __init__(self, *kw): a keyword based constructor, which just initialize the
   fields with the given values.
 * cls.query_db(**where): return a list of entities that satisfies the criteria
-  stated in the `where` parameters.
+  stated in the `where` parameters. The optional `order_by` and `limit`
+  parameters are added to the SQL as is.
+* cls.iter_db(**where): similar as `query_db`, but return a generator that
+  reads the rows in batches.
 * cls.query_db_fields(field_names, **where): similar as `query_db`, return a
   list sqlite3.Row objects.
+* cls.iter_rows(field_names, **where): a generator of namedtuples, the compact
+  read-only rows for history and reports.
 * save_to_db(fields=[]): insert or update the entity. If the entity is not saved
     before, the `fields` parameter is ignored. Otherwise, only update the fields
-    listed in `fields` parameter.
+    listed in `fields` parameter. An insert waits for the new row id, an update
+    is just submitted to the database writer (see `db.submit`).
+    
+    The assignments to the fields are tracked, an update only writes the fields
+    that are changed since the entity is loaded or saved. If nothing changed,
+    the database is not touched at all (counted as a "skipped_writes").
 * cls.create(*args, **kw): create an instance by passing all arguments to the
   constructor, then save to database by calling the save_to_db method. method
   which will insert or update an instance of the subclass to the corresponding
   table.
+* cls.bulk_create(entities), cls.bulk_save(entities, fields=[]),
+  cls.bulk_delete(entities): the bulk version of `save_to_db` and
+  `delete_from_db`, which write all the entities in one transaction.
+* Identity map: when the database is opened with an identity map (see
+  `db.open_database`), loading a row that is already loaded returns the live
+  entity, so that there is only one entity for each row.
+* cls.statistics(): the counters of the class, such as the hits and misses of
+  the SQL cache. The SQL statements are cached per class, they always use bound
+  parameters for values.
 """
+from collections import Counter, namedtuple
+from concurrent.futures import Future
+
 import db
 
 class WrongFieldNameError(NameError):
@@ -37,6 +59,8 @@ class WrongFieldNameError(NameError):
 
 class WrongFieldValueError(ValueError): pass
 
+_missing = object()
+
 def maybe_apply(f, v):
     return None if v is None else f(v)
     
@@ -68,12 +92,32 @@ class Model:
             raise WrongFieldValueError(f'"id" field is reserved for row id, it \
                 must be 0 before it get the real row id from database.')
         setattr(cls, 'id', None)
+        # SQL statements built for this class, keyed by (operation, fields,
+        # where conditions)
+        cls._sql_cache = {}
+        cls._stats = Counter()
     
     def __init__(self, **field_values):
         for name, value in field_values.items():
             if name not in self._fields:
                 raise WrongFieldNameError(name, self._table_name)
             setattr(self, name, value)
+    
+    def __setattr__(self, name, value):
+        # track the changed fields, so that only they are saved
+        if name in self._fields and self.__dict__.get(name, _missing) != value:
+            self.__dict__.setdefault('_dirty', set()).add(name)
+        super().__setattr__(name, value)
+    
+    def dirty_fields(self):
+        """Return the fields that are changed since the entity is loaded or saved."""
+        return self.__dict__.get('_dirty', set())
+    
+    def _mark_clean(self, fields=None):
+        if fields is None:
+            self.__dict__['_dirty'] = set()
+        else:
+            self.dirty_fields().difference_update(fields)
             
     @classmethod
     def create(cls, *args, **kw):
@@ -86,85 +130,320 @@ class Model:
         return db.execute_query(sql, parameters)
         
     @classmethod
-    def query_db(cls, where=None, **where_more):
-        sql, params = cls._build_query_sql(cls._fields, where, **where_more)   
+    def query_db(cls, where=None, order_by=None, limit=None, use_identity_map=True, **where_more):
+        sql, params = cls._build_query_sql(cls._fields, where, order_by, limit, **where_more)   
         data_list =  db.execute_query(sql, params)
-        entities = [cls(**data) for data in data_list]
+        entities = cls._materialize(data_list, use_identity_map)
         return entities
     
     @classmethod
-    def query_db_fields(cls, fields, where=None, **where_more):
-        sql, params = cls._build_query_sql(fields, where, **where_more)
+    def query_db_fields(cls, fields, where=None, order_by=None, limit=None, **where_more):
+        sql, params = cls._build_query_sql(fields, where, order_by, limit, **where_more)
         return db.execute_query(sql, params)
+    
+    @classmethod
+    def iter_db(cls, where=None, order_by=None, batch_size=500, use_identity_map=True, **where_more):
+        """A generator version of `query_db`, which keeps at most `batch_size` rows in memory.
+        
+        Without `order_by`, the rows are read in pages ordered by id (keyset
+        pagination), so no read transaction is kept open between the pages.
+        Otherwise the rows are fetched from one cursor, `batch_size` at a time.
+        
+        Read-only scans should pass `use_identity_map=False`, so that the
+        entities are not registered in the identity map.
+        """
+        if order_by is not None:
+            sql, params = cls._build_query_sql(cls._fields, where, order_by, **where_more)
+            for data_list in db.iter_batches(sql, params, batch_size):
+                yield from cls._materialize(data_list, use_identity_map)
+            return
+        
+        where = dict(where or {})
+        where['id >'] = 0
+        while True:
+            sql, params = cls._build_query_sql(cls._fields, where, 'id', batch_size, **where_more)
+            data_list = db.execute_query(sql, params)
+            yield from cls._materialize(data_list, use_identity_map)
+            if len(data_list) < batch_size:
+                return
+            where['id >'] = data_list[-1]['id']
         
     def save_to_db(self, fields = []):
         # verify field names
         if fields == []: 
             fields = list(self._fields.keys())
         else:
-            for k in fields:
-                if k not in self._fields:
-                    raise WrongFieldNameError(k, self._table_name)
+            self._check_fields(fields)
         
-        # should not change the 'id' field
-        fields = [name for name in fields if name != 'id']
+        # should not change the 'id' field, and only the changed fields of a
+        # saved entity are written
+        if self.id is None:
+            fields = tuple(name for name in fields if name != 'id')
+        else:
+            dirty = self.dirty_fields()
+            fields = tuple(name for name in fields if name != 'id' and name in dirty)
+            if not fields:
+                self._stats['skipped_writes'] += 1
+                return
         
         sql = self._update_to_db_sql(fields) if self.id is not None else self._insert_to_db_sql(fields)
-        parameters = tuple(maybe_apply(self._fields[k], getattr(self, k)) for k in fields)
+        parameters = self._db_values(self, fields)
+        if self.id is not None:
+            parameters += (self.id,)
         
-        lastrowid = db.execute_commit(sql, parameters)
         if self.id is None:
-            self.id = lastrowid
+            self.id = db.execute_commit(sql, parameters)
+            self._mark_clean()
+            self._register()
+        else:
+            db.submit_commit(sql, parameters)
+            self._mark_clean(fields)
     
     def delete_from_db(self):
         sql = self._delete_from_db_sql()
-        db.execute_commit(sql, (self.id,))
+        db.submit_commit(sql, (self.id,))
+        self._unregister()
+    
+    @classmethod
+    def bulk_create(cls, entities, conn=None):
+        """Insert the new entities in one transaction, and assign their ids.
+        
+        If `conn` is given, the statements are executed in that connection (as
+        part of the caller's transaction), otherwise they are submitted as one
+        write transaction.
+        """
+        entities = list(entities)
+        if not entities:
+            return entities
+        fields = tuple(name for name in cls._fields if name != 'id')
+        sql = cls._insert_to_db_sql(fields)
+        rows = [cls._db_values(entity, fields) for entity in entities]
+        def job(conn):
+            # one insert per row, the row ids of a multi-row insert are not
+            # always consecutive (an explicit id, a reused id of a deleted row)
+            return [conn.execute(sql, row).lastrowid for row in rows]
+        ids = cls._run_job(job, conn, urgent=True).result()
+        # the ids are only assigned when all the rows are inserted
+        for entity, id in zip(entities, ids):
+            entity.id = id
+        for entity in entities:
+            entity._mark_clean()
+            entity._register()
+        return entities
+    
+    @classmethod
+    def bulk_save(cls, entities, fields=[], conn=None):
+        """Save the entities in one transaction.
+        
+        The unsaved entities are inserted (see `bulk_create`), and the `fields`
+        of the others are updated, if one of them is changed.
+        """
+        entities = list(entities)
+        if fields == []:
+            fields = list(cls._fields.keys())
+        else:
+            cls._check_fields(fields)
+        fields = tuple(name for name in fields if name != 'id')
+        new_entities = [e for e in entities if e.id is None]
+        saved_entities = [e for e in entities
+            if e.id is not None and not e.dirty_fields().isdisjoint(fields)]
+        cls._stats['skipped_writes'] += len(entities) - len(new_entities) - len(saved_entities)
+        sql = cls._update_to_db_sql(fields)
+        rows = [cls._db_values(entity, fields) + (entity.id,) for entity in saved_entities]
+        def job(conn):
+            cls.bulk_create(new_entities, conn)
+            if rows:
+                conn.executemany(sql, rows)
+        future = cls._run_job(job, conn, urgent=True)
+        future.result()
+        # the entities are only clean when the write has succeeded
+        for entity in saved_entities:
+            entity._mark_clean(fields)
+        return future
+    
+    @classmethod
+    def bulk_delete(cls, entities, conn=None):
+        """Delete the entities with one `executemany`."""
+        sql = cls._delete_from_db_sql()
+        rows = [(entity.id,) for entity in entities]
+        for entity in entities:
+            entity._unregister()
+        return cls._run_job(lambda conn: conn.executemany(sql, rows), conn)
+    
+    @classmethod
+    def iter_rows(cls, fields=None, where=None, order_by=None, batch_size=500, **where_more):
+        """Like `iter_db`, but yield light weight read-only rows (see `row_type`).
+        
+        `fields` is a list of fields to read, default to all the fields.
+        """
+        fields = tuple(fields or cls._fields)
+        make_row = cls.row_type(fields)._make
+        sql, params = cls._build_query_sql(fields, where, order_by, **where_more)
+        return db.iter_query(sql, params, batch_size, lambda cursor, row: make_row(row))
+    
+    @classmethod
+    def row_type(cls, fields):
+        """Return a namedtuple class that holds the given fields of a row."""
+        fields = tuple(fields)
+        row_types = cls.__dict__.get('_row_types')
+        if row_types is None:
+            row_types = cls._row_types = {}
+        if fields not in row_types:
+            cls._check_fields(fields)
+            row_types[fields] = namedtuple(f'{cls.__name__}Row', fields)
+        return row_types[fields]
+    
+    @classmethod
+    def _materialize(cls, data_list, use_identity_map=True):
+        """Make entities from the rows of the table.
+        
+        The rows are trusted to have valid fields, so the constructor is not
+        called, and the values are put into the entities directly. Subclasses
+        can finish the initialization in `_on_load`.
+        
+        If the identity map is enabled, and the row is already loaded, the live
+        entity is returned. Its fields are refreshed from the row, since the
+        row may be changed by a set-based write (a trigger, an UPDATE of many
+        rows, an import), except the fields that are changed and not saved yet.
+        """
+        if not data_list:
+            return []
+        keys = data_list[0].keys()
+        id_index = keys.index('id')
+        identity_map = db.get_identity_map() if use_identity_map else None
+        entities = []
+        for data in data_list:
+            if identity_map is not None:
+                key = (cls._table_name, data[id_index])
+                entity = identity_map.get(key)
+                if entity is not None:
+                    dirty = entity.dirty_fields()
+                    entity.__dict__.update((name, value) for name, value in zip(keys, data)
+                        if name in cls._fields and name not in dirty)
+                    entities.append(entity)
+                    continue
+            entity = cls.__new__(cls)
+            entity.__dict__.update(zip(keys, data))
+            entity._on_load()
+            if identity_map is not None:
+                identity_map[key] = entity
+            entities.append(entity)
+        return entities
+    
+    def _on_load(self):
+        """Called after an entity is made from a database row."""
+        pass
+    
+    def _register(self):
+        db.register_entity((self._table_name, self.id), self)
+    
+    def _unregister(self):
+        db.register_entity((self._table_name, self.id), None)
+    
+    @staticmethod
+    def _run_job(job, conn, urgent=False):
+        if conn is None:
+            return db.submit(job, urgent)
+        future = Future()
+        future.set_result(job(conn))
+        return future
+    
+    @classmethod
+    def _db_values(cls, entity, fields):
+        return tuple(maybe_apply(cls._fields[k], getattr(entity, k)) for k in fields)
+    
+    @classmethod
+    def statistics(cls):
+        """Return the counters of this class, such as the SQL cache hits and misses."""
+        return dict(cls._stats)
+    
+    @classmethod
+    def _cached_sql(cls, key, build):
+        """Return the SQL for `key` from the cache, call `build()` to make it on a miss.
         
-    def _update_to_db_sql(self, fields):
-        set_clause = ', '.join(field + " = ?" for field in fields) # "name=?, age=?"
-        sql = f'''UPDATE {self._table_name}
+        The SQL text only depends on the key (all values are bound parameters),
+        so that sqlite3's statement cache can reuse the prepared statements too.
+        """
+        sql = cls._sql_cache.get(key)
+        if sql is None:
+            cls._stats['sql_cache_misses'] += 1
+            sql = cls._sql_cache[key] = build()
+        else:
+            cls._stats['sql_cache_hits'] += 1
+        return sql
+    
+    @classmethod
+    def _check_fields(cls, fields):
+        for f in fields:
+            if f not in cls._fields:
+                raise WrongFieldNameError(f, cls._table_name)
+    
+    @classmethod
+    def _update_to_db_sql(cls, fields):
+        def build():
+            cls._check_fields(fields)
+            set_clause = ', '.join(field + " = ?" for field in fields) # "name=?, age=?"
+            return f'''UPDATE {cls._table_name}
             SET {set_clause}
-            WHERE id = {self.id}
+            WHERE id = ?
         '''
-        return sql
+        return cls._cached_sql(('update', tuple(fields)), build)
         
-    def _insert_to_db_sql(self, fields):
-        sql = f'''INSERT INTO {self._table_name}
+    @classmethod
+    def _insert_to_db_sql(cls, fields):
+        def build():
+            cls._check_fields(fields)
+            return f'''INSERT INTO {cls._table_name}
             ({', '.join(fields)})
             VALUES ({','.join("?"*len(fields))})
         '''
-        return sql
+        return cls._cached_sql(('insert', tuple(fields)), build)
     
-    def _delete_from_db_sql(self):
-        sql = f'DELETE FROM {self._table_name} WHERE id = ?'
-        return sql
+    @classmethod
+    def _delete_from_db_sql(cls):
+        return cls._cached_sql(('delete',),
+            lambda: f'DELETE FROM {cls._table_name} WHERE id = ?')
         
     @classmethod
-    def _build_query_sql(cls, fields=['*'], where=None, **where_more):
-        if where is None:
-            where = {}
+    def _build_query_sql(cls, fields=['*'], where=None, order_by=None, limit=None, **where_more):
+        """Build a SELECT statement.
+        
+        `order_by` is a field name or a list of them, each optionally followed
+        by "ASC" or "DESC". `limit` is the maximum number of rows.
+        """
+        where = dict(where or {})
         for k, v in where_more.items():
             where[f'{k} ='] = v
-            
-        criterial = []
-        parameters = []
-        for k, v in where.items():
-            field_name = k.split()[0]
-            if field_name not in cls._fields:
-                print(f'{cls._fields=}')
-                raise WrongFieldNameError(k, cls._table_name)
+        if isinstance(order_by, str):
+            order_by = [order_by]
+        
+        fields = tuple(fields)
+        conditions = tuple(where.keys())
+        orders = tuple(order_by or ())
+        def build():
+            field_names = [k.split()[0] for k in conditions]
+            cls._check_fields(field_names)
+            if fields != ('*',):
+                cls._check_fields(fields)
+            for order in orders:
+                name, *direction = order.split()
+                if direction not in ([], ['ASC'], ['DESC'], ['asc'], ['desc']):
+                    raise WrongFieldNameError(order, cls._table_name)
+                cls._check_fields([name])
+            criterial = [f'{k} ?' for k in conditions]
+            if criterial:
+                where_clause = " WHERE " + " AND ".join(criterial)
             else:
-                criterial.append(f'{k} ?')
-                parameters.append(maybe_apply(cls._fields[field_name], v))
-        if criterial:
-            where_clause = " WHERE " + " AND ".join(criterial)
-        else:
-            where_clause = ""
-            
-        if fields != ['*']:
-            for f in fields:
-                if f not in cls._fields:
-                    raise WrongFieldNameError(f, cls._table_name)
-        sql = f'SELECT {", ".join(fields)} FROM {cls._table_name}{where_clause}'
+                where_clause = ""
+            if orders:
+                where_clause += " ORDER BY " + ", ".join(orders)
+            if limit is not None:
+                where_clause += " LIMIT ?"
+            sql = f'SELECT {", ".join(fields)} FROM {cls._table_name}{where_clause}'
+            return sql, [cls._fields[name] for name in field_names]
+        key = ('select', fields, conditions, orders, limit is not None)
+        sql, converters = cls._cached_sql(key, build)
+        parameters = [maybe_apply(f, v) for f, v in zip(converters, where.values())]
+        if limit is not None:
+            parameters.append(limit)
         return sql, parameters
-        
\ No newline at end of file
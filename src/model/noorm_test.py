@@ -31,15 +31,16 @@ class NoORMTest(unittest.TestCase):
             name = 'John'
             age = 10
             passed = 1
-            def __init__(self, name, age, passed):
+            def __init__(self, name, age, passed, id=None):
                 self.name = name
                 self.age = age
                 self.passed = passed
+                self.id = id
         self.A = A
         
         import db
         db.open_database(":memory:")
-        create_table_sql = """CREATE TABLE A (id INT PRIMARY KEY,  age INT, name TEXT, passed INT);
+        create_table_sql = """CREATE TABLE A (id INTEGER PRIMARY KEY,  age INT, name TEXT, passed INT);
         """
         db.execute_commit(create_table_sql, ())
     def test_select_field_error(self):
@@ -70,6 +71,40 @@ class NoORMTest(unittest.TestCase):
         self.assertEqual(sql, expected_sql)
         self.assertEqual(params, [5])
         
+    def test_select_order_limit_sql(self):
+        expected_sql = "SELECT name FROM a WHERE age = ? ORDER BY age DESC, name LIMIT ?"
+        sql, params = self.A._build_query_sql(['name'], order_by=['age DESC', 'name'], limit=3, age=5)
+        self.assertEqual(sql, expected_sql)
+        self.assertEqual(params, [5, 3])
+
+    def test_select_order_by_error(self):
+        with self.assertRaises(WrongFieldNameError):
+            self.A._build_query_sql(order_by='grade')
+        with self.assertRaises(WrongFieldNameError):
+            self.A._build_query_sql(order_by='age; DROP TABLE a')
+
+    def test_iter_db(self):
+        self.A.bulk_create(self.A(f"name{i}", i % 3, False) for i in range(10))
+        ids = [a.id for a in self.A.iter_db(batch_size=3)]
+        self.assertEqual(ids, list(range(1, 11)))
+        ages = [a.age for a in self.A.iter_db(order_by='age DESC', batch_size=3, passed=False)]
+        self.assertEqual(ages, sorted((i % 3 for i in range(10)), reverse=True))
+
+    def test_loaded_entities_skip_constructor(self):
+        self.A.create("mary", 12, True)
+        self.A.__init__ = mock = Mock()
+        a = self.A.query_db(use_identity_map=False)[0]
+        mock.assert_not_called()
+        self.assertEqual((a.id, a.name, a.age, a.passed), (1, "mary", 12, 1))
+        self.assertEqual(a.dirty_fields(), set())
+
+    def test_iter_rows(self):
+        self.A.bulk_create(self.A(f"name{i}", i, False) for i in range(3))
+        rows = list(self.A.iter_rows(['name', 'age'], {'age >': 0}, order_by='age DESC'))
+        self.assertEqual(rows, [('name2', 2), ('name1', 1)])
+        self.assertEqual(rows[0].name, 'name2')
+        self.assertIs(type(rows[0]), self.A.row_type(['name', 'age']))
+
     def test_insert_sql(self):
         a = self.A("Mary", 12, True)
         expected_sql = """INSERT INTO a
@@ -84,7 +119,7 @@ class NoORMTest(unittest.TestCase):
         sql = a._update_to_db_sql(['name', 'age'])
         expected_sql = """UPDATE a
             SET name = ?, age = ?
-            WHERE id = 1
+            WHERE id = ?
         """
         self.multi_line_equal(sql, expected_sql)
         
@@ -102,9 +137,112 @@ class NoORMTest(unittest.TestCase):
         a.save_to_db()
         sql = a._update_to_db_sql(['name'])
         a._update_to_db_sql = mock = Mock(return_value=sql)
+        a.name = "jane"
         a.save_to_db(['name'])
         mock.assert_called()
         
+    def test_sql_is_cached(self):
+        a = self.A("mary", 12, True)
+        a.save_to_db()
+        a.name = "jane"
+        a.save_to_db(['name'])
+        b = self.A("john", 13, False)
+        b.save_to_db()
+        b.name = "tom"
+        b.save_to_db(['name'])
+        stats = self.A.statistics()
+        self.assertEqual(stats['sql_cache_misses'], 2)
+        self.assertEqual(stats['sql_cache_hits'], 2)
+
+    def test_query_sql_is_cached(self):
+        sql1, params1 = self.A._build_query_sql(['name'], {'age >': 5}, passed=True)
+        sql2, params2 = self.A._build_query_sql(['name'], {'age >': 7}, passed=False)
+        self.assertEqual(sql1, sql2)
+        self.assertEqual(params1, [5, True])
+        self.assertEqual(params2, [7, False])
+        self.assertEqual(self.A.statistics()['sql_cache_hits'], 1)
+
+    def test_only_changed_fields_are_saved(self):
+        a = self.A.create("mary", 12, True)
+        a._update_to_db_sql = mock = Mock(side_effect=self.A._update_to_db_sql)
+        a.age = 13
+        a.passed = True # not changed
+        a.save_to_db()
+        mock.assert_called_once_with(('age',))
+        self.assertEqual(a.dirty_fields(), set())
+        self.assertEqual(self.A.query_db_fields(['age'], id=a.id)[0][0], 13)
+
+    def test_unchanged_entity_is_not_saved(self):
+        a = self.A.create("mary", 12, True)
+        loaded = self.A.query_db(id=a.id, use_identity_map=False)[0]
+        loaded.save_to_db()
+        self.A.bulk_save([a, loaded], ['name'])
+        self.assertEqual(self.A.statistics()['skipped_writes'], 3)
+
+    def test_bulk_create_assigns_ids(self):
+        self.A.create("first", 1, True)
+        entities = self.A.bulk_create(self.A(f"name{i}", i, False) for i in range(3))
+        self.assertEqual([a.id for a in entities], [2, 3, 4])
+        rows = self.A.query_db_fields(['id', 'name'], {'id >': 1})
+        self.assertEqual([tuple(row) for row in rows], [(2, 'name0'), (3, 'name1'), (4, 'name2')])
+
+    def test_bulk_create_ids_are_not_consecutive(self):
+        import db
+        # once the largest row id is taken, SQLite picks unused ids at random
+        db.execute_commit('INSERT INTO A (id, name) VALUES (?, ?)', (2**63 - 1, 'last'))
+        entities = self.A.bulk_create(self.A(f"name{i}", i, False) for i in range(3))
+        rows = self.A.query_db_fields(['id', 'name'], {'id <': 2**63 - 1}, order_by='name')
+        self.assertEqual([tuple(row) for row in rows], [(a.id, a.name) for a in entities])
+
+    def test_bulk_save(self):
+        saved = self.A.bulk_create([self.A("mary", 12, True), self.A("john", 13, True)])
+        for a in saved:
+            a.age += 10
+            a.name = 'changed'
+        new = self.A("tom", 9, False)
+        self.A.bulk_save(saved + [new], ['age'])
+        self.assertEqual(new.id, 3)
+        rows = self.A.query_db_fields(['name', 'age'])
+        self.assertEqual([tuple(row) for row in rows], [('mary', 22), ('john', 23), ('tom', 9)])
+
+    def test_failed_bulk_save_keeps_the_changes(self):
+        import db, sqlite3
+        saved = self.A.bulk_create([self.A("mary", 12, True), self.A("john", 13, True)])
+        db.execute_commit('CREATE TRIGGER no_update BEFORE UPDATE ON A BEGIN SELECT RAISE(ABORT, "read only"); END', ())
+        for a in saved:
+            a.age += 10
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.A.bulk_save(saved, ['age'])
+        self.assertEqual([a.dirty_fields() for a in saved], [{'age'}, {'age'}])
+        self.assertEqual([row[0] for row in self.A.query_db_fields(['age'])], [12, 13])
+
+    def test_bulk_delete(self):
+        entities = self.A.bulk_create(self.A(f"name{i}", i, False) for i in range(3))
+        self.A.bulk_delete(entities[:2])
+        rows = self.A.query_db_fields(['id'])
+        self.assertEqual([row[0] for row in rows], [3])
+
+    def test_live_entity_is_refreshed_from_row(self):
+        import db
+        a = self.A.create("mary", 12, True)
+        a.name = 'changed'
+        db.execute_commit('UPDATE A SET age = age + 1, name = ?', ('other',))
+        loaded = self.A.query_db(id=a.id)[0]
+        self.assertIs(loaded, a)
+        # the unsaved change is kept
+        self.assertEqual((a.name, a.age), ('changed', 13))
+        self.assertEqual(a.dirty_fields(), {'name'})
+
+    def test_identity_change_on_owner_thread_is_applied_at_once(self):
+        import db, gc
+        a = self.A.create("mary", 12, True)
+        self.assertIs(db.identity_map[('a', a.id)], a)
+        self.assertFalse(db._pending_identity_changes)
+        a_id = a.id
+        del a
+        gc.collect()
+        self.assertNotIn(('a', a_id), db.identity_map)
+
     def multi_line_equal(self, s1, s2:str) :
         """compare multiple line strings s1 and s2
         
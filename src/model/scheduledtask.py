@@ -5,6 +5,9 @@ from .noorm import Model
 from dateutils import lastest_valid_date_before
 from model import models 
 
+# the number of days before today that are caught up if the app didn't run
+CATCH_UP_DAYS = 366
+
 @dataclass
 class ScheduledTask(Model):
     """A ScheduledTask is a task template to generate a task on a certain day
@@ -16,8 +19,12 @@ class ScheduledTask(Model):
     once: a single day on which the task will be generated. It stores the
     ordinal of that day.
 
-    pattern: a repeat pattern for repeatedly occurred task. It's a string of 4
-    comma seprated ints. (see PeriodicScheduler for more detail of the format.) 
+    repeat_year, repeat_month, repeat_day, repeat_weekday: the repeat pattern
+    for repeatedly occurred task, -1 for an unspecified field (see
+    PeriodicScheduler for more detail of the format). `scheduler` is the
+    PeriodicScheduler of the pattern. The table also has a generated
+    `repeat_type` column, the type of the pattern ('w', 'm', 'y', 'o', or
+    NULL for no pattern).
 
     next_event: it's just a cache that saves the calculated next event, so that
     before the next_event happends, the schedular will not be called again.
@@ -30,7 +37,10 @@ class ScheduledTask(Model):
         'id': int,
         # info for when to generate
         'once': int,    
-        'pattern': str, 
+        'repeat_year': int,
+        'repeat_month': int,
+        'repeat_day': int,
+        'repeat_weekday': int,
         'next_event': int,
         'last_gen': int,
         'done': bool,
@@ -39,31 +49,126 @@ class ScheduledTask(Model):
         'tomato': int,
         'type': str
     }
+    repeat_year = -1
+    repeat_month = -1
+    repeat_day = -1
+    repeat_weekday = -1
     LONG = '='
     SHORT = '-'
     TODO = '.'
     
+    # the schedules for which `generate_for_date(:today)` has something to do:
+    # a repeat pattern whose next event is due (0: not computed yet), or a
+    # one-time day that is due and not examined yet
+    _due_condition = '''done = 0 AND last_gen < :today
+        AND (next_event <= :today AND repeat_type IS NOT NULL OR once <= :today AND once > last_gen)'''
+    
+    @classmethod
+    def load_due(cls, today):
+        """Load the schedules that are due on `today`, with the indexes on (done, next_event) and (done, once)."""
+        sql = cls._cached_sql('load_due', lambda: f'''SELECT {", ".join(cls._fields)}
+            FROM {cls._table_name} WHERE {cls._due_condition}''')
+        return cls._materialize(cls.execute_query(sql, dict(today=today)))
+    
+    @classmethod
+    def save_generated(cls, schedules, today, conn):
+        """Save the changes of the due schedules after `generate_for_date(today)`.
+        
+        `last_gen` of all of them is set with one UPDATE, before the other
+        changes, which may make them not due.
+        """
+        sql = cls._cached_sql('mark_generated', lambda:
+            f'UPDATE {cls._table_name} SET last_gen = :today WHERE {cls._due_condition}')
+        conn.execute(sql, dict(today=today))
+        for schedule in schedules:
+            schedule._mark_clean(['last_gen'])
+        cls.bulk_save(schedules, ['next_event', 'done'], conn)
+    
+    @property
+    def scheduler(self):
+        """The PeriodicScheduler of the repeat pattern, shared by the schedules with the same pattern."""
+        return PeriodicScheduler.interned(self.repeat_year, self.repeat_month,
+            self.repeat_day, self.repeat_weekday)
+    
+    def next_due_day(self):
+        """Return the first day after `last_gen` on which the schedule is due (see `load_due`), None if never."""
+        if self.done:
+            return None
+        days = []
+        if self.scheduler.type is not None:
+            days.append(self.next_event)
+        if self.once and self.once > self.last_gen:
+            days.append(self.once)
+        return max(min(days), self.last_gen + 1) if days else None
+    
     def get_task_for_date(self, day_ordinal):
         "Get the (possibly) new task for `today`."
+        task, changed_fields = self.generate_for_date(day_ordinal)
+        if task is not None:
+            task.save_to_db()
+        if changed_fields:
+            self.save_to_db(changed_fields)
+        return task
+    
+    def generate_for_date(self, day_ordinal):
+        """Return the (possibly) new task for `today` and the changed fields of self.
+        
+        Neither the new task nor the changes are saved to the database, so
+        that they can be saved in bulk. The days before `today` are not
+        caught up, see `generate_until`.
+        """
+        tasks, changed_fields = self.generate_until(day_ordinal, catch_up_days=1)
+        return (tasks[-1][1] if tasks else None), changed_fields
+    
+    def generate_until(self, day_ordinal, catch_up_days=CATCH_UP_DAYS):
+        """Return the new tasks of the days after `last_gen` until `day_ordinal`, and the changed fields of self.
         
+        The tasks are a list of (day ordinal, new task), by day. The days on
+        which the app didn't run are caught up, at most `catch_up_days` days
+        (the last one is `day_ordinal`). A schedule that was never examined
+        only generates the task of `day_ordinal`. Neither the new tasks nor
+        the changes are saved to the database.
+        """
+        generated, (changed_fields,) = self.generate_all_until([self], day_ordinal, catch_up_days)
+        return [(day, task) for day, _, task in generated], changed_fields
+    
+    @classmethod
+    def generate_all_until(cls, schedules, day_ordinal, catch_up_days=CATCH_UP_DAYS):
+        """The batch version of `generate_until`, for the catch-up of all the due schedules.
+        
+        Return a list of (day ordinal, schedule, new task) by day, and the
+        list of the changed fields of each schedule. The occurrences are
+        expanded in one pass (see `expand`), so the days of a repeat pattern,
+        and its next event, are computed once for all the schedules that
+        share it.
+        """
         # check if we have tried for today
-        if self.last_gen >= day_ordinal:
-            return None
-            
-        # A ScheduledTask may generate a new task for one of two reasons:
-        # 1. the onetime schedule applies
-        onetime_applies = self.once == day_ordinal
+        due = [schedule for schedule in schedules if schedule.last_gen < day_ordinal]
+        # A ScheduledTask generates a new task on the onetime day, and on the
+        # days of the "repeat" setting
+        first_days = {id(schedule): (max(schedule.last_gen + 1, day_ordinal - catch_up_days + 1)
+            if schedule.last_gen else day_ordinal) for schedule in due}
+        first_day = min(first_days.values(), default=day_ordinal)
+        generated = [(day, schedule, schedule.make_task())
+            for day, schedule in cls.expand(due, first_day, day_ordinal)
+            if day >= first_days[id(schedule)]]
+        next_events = {}
+        changed_fields = [schedule._update_generated(day_ordinal, next_events)
+            if id(schedule) in first_days else [] for schedule in schedules]
+        return generated, changed_fields
+    
+    def _update_generated(self, day_ordinal, next_events):
+        """Update the bookkeeping after the tasks until `day_ordinal` are generated, return the changed fields.
         
-        # 2. the "repeat" setting applies
+        `next_events` keeps the next event of each scheduler after `day_ordinal`.
+        """
         if self.next_event >= day_ordinal: # the cache is still valid
             next_event = self.next_event
         else:
-            scheduler = PeriodicScheduler.from_string(self.pattern)
-            next_event = scheduler.next_occurrance_after(day_ordinal)
-        repeat_pattern_applies = next_event == day_ordinal
-
-        should_schedule = onetime_applies or repeat_pattern_applies
-        result = self.make_task() if should_schedule else None
+            if self.scheduler not in next_events:
+                occurrence = self.scheduler.next_occurrance_after(day_ordinal)
+                next_events[self.scheduler] = occurrence.toordinal() if occurrence else 0
+            next_event = next_events[self.scheduler]
         
         # bookkeeping
         changed_fields = ['last_gen']
@@ -79,14 +184,32 @@ class ScheduledTask(Model):
             changed_fields.append('next_event')
         else:
             pass
-        self.save_to_db(changed_fields)
-        return result
+        return changed_fields
+    
+    def occurrences_between(self, first_day, last_day):
+        """Return the sorted day ordinals in [first_day, last_day] on which a task is scheduled."""
+        return _schedule_days(self.once, self.scheduler, first_day, last_day, {})
+    
+    @classmethod
+    def expand(cls, schedules, first_day, last_day):
+        """Return the (day ordinal, schedule) of all the occurrences of `schedules` in
+        [first_day, last_day], by day, for an agenda of the next days.
+        
+        The days of a repeat pattern are computed once for all the schedules
+        that share it. The finished schedules are skipped.
+        """
+        memo = {}
+        occurrences = [(day, schedule) for schedule in schedules if not schedule.done
+            for day in _schedule_days(schedule.once, schedule.scheduler, first_day, last_day, memo)]
+        occurrences.sort(key=lambda occurrence: occurrence[0])
+        return occurrences
     
     def make_task(self):
+        "Make a new (unsaved) task or todo."
         if self.type == self.TODO:
-            return models.Todo.create(description=self.title)
+            return models.Todo(description=self.title)
         else:
-            return models.Task.create(
+            return models.Task(
                 description=self.title,
                 tomato=int(self.tomato),
                 long_session=self.type == self.LONG
@@ -97,7 +220,6 @@ class ScheduledTask(Model):
         self.tomato = 0
         self.type = ''
         self.once = 1
-        self.pattern =''
         
 class PeriodicScheduler:
     """Specify a repeat pattern of days.
@@ -105,18 +227,36 @@ class PeriodicScheduler:
     The pattern is described with four fields: year, month, day, week. Each field can be appropriate
     number for that field or -1 for unspecified.
     """
+    # the shared schedulers, by (year, month, day, weekday)
+    _interned = {}
+    
     def __init__(self, year = -1, month = -1, day = -1, weekday = -1):
         self.year = year
         self.month = month
         self.day = day
         self.weekday = weekday
+        self.type = self.get_type()
+    
+    @classmethod
+    def interned(cls, year, month, day, weekday):
+        """Return the shared scheduler of a pattern, it must not be changed."""
+        key = (year, month, day, weekday)
+        scheduler = cls._interned.get(key)
+        if scheduler is None:
+            scheduler = cls._interned[key] = cls(*key)
+        return scheduler
+    
+    def repeat_fields(self):
+        """Return the fields of a ScheduledTask that store the pattern."""
+        return dict(repeat_year=self.year, repeat_month=self.month,
+            repeat_day=self.day, repeat_weekday=self.weekday)
         
     def next_occurrance_after(self, start_ordianl):
         """Return the next occurrance of a day that matches the pattern and no before than the day `start`.
         """
         start = date.fromordinal(start_ordianl)
         year, month, day, weekday = start.year, start.month, start.day, start.weekday()
-        cycle_type = self.get_type()
+        cycle_type = self.type
         if cycle_type is None:
             return None
         elif cycle_type == 'o':
@@ -143,6 +283,34 @@ class PeriodicScheduler:
         else:
             return None # should not happen
             
+    def occurrences_between(self, first_day, last_day):
+        """Return the day ordinals in [first_day, last_day] (both included) that match the pattern.
+        
+        The days are computed from the ordinals, without making a date for
+        each candidate day, so a window of months is expanded at once. As in
+        `next_occurrance_after`, a day past the end of a month means the
+        last day of the month.
+        """
+        cycle_type = self.type
+        if cycle_type is None or first_day > last_day:
+            return []
+        if cycle_type == 'w':
+            # day ordinal 1 (0001-01-01) is a Monday
+            first = first_day + (self.weekday - (first_day - 1)) % 7
+            return list(range(first, last_day + 1, 7))
+        if cycle_type == 'o':
+            the_day = _day_ordinal(self.year, max(1, min(self.month, 12)), self.day)
+            return [the_day] if first_day <= the_day <= last_day else []
+        first_year = date.fromordinal(first_day).year
+        last_year = date.fromordinal(last_day).year
+        if cycle_type == 'y':
+            days = (_day_ordinal(year, self.month, self.day)
+                for year in range(first_year, last_year + 1))
+        else:
+            days = (_day_ordinal(year, month, self.day)
+                for year in range(first_year, last_year + 1) for month in range(1, 13))
+        return [day for day in days if first_day <= day <= last_day]
+            
     def should_schedule(self, day):
         return self.next_occurrance_after(day) == day
             
@@ -172,3 +340,29 @@ class PeriodicScheduler:
         if len(pattern) != 4:
             pattern = [-1]*4
         return cls(*pattern)
+
+# the number of days before each month in a common year
+_DAYS_BEFORE_MONTH = [0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+_DAYS_IN_MONTH = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+def _is_leap(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+def _day_ordinal(year, month, day):
+    """Return the ordinal of a day, a day past the end of the month is the last day of the month."""
+    leap = month > 2 and _is_leap(year)
+    day = min(day, 29 if month == 2 and _is_leap(year) else _DAYS_IN_MONTH[month])
+    y = year - 1
+    return y * 365 + y // 4 - y // 100 + y // 400 + _DAYS_BEFORE_MONTH[month] + leap + day
+
+def _schedule_days(once, scheduler, first_day, last_day, memo):
+    """Return the days of a schedule (its `once` day and its repeat pattern) in the window.
+    
+    The days of a pattern are kept in `memo`, many schedules share a pattern.
+    """
+    if scheduler not in memo:
+        memo[scheduler] = scheduler.occurrences_between(first_day, last_day)
+    days = memo[scheduler]
+    if once and first_day <= once <= last_day and once not in days:
+        days = sorted([*days, once])
+    return days
@@ -1,7 +1,7 @@
 import unittest
 from datetime import date
 
-from .scheduledtask import PeriodicScheduler
+from .scheduledtask import PeriodicScheduler, ScheduledTask
 from dateutils import Weekdays
 
 class PeriodicSchedulerTest(unittest.TestCase):
@@ -98,4 +98,127 @@ class PeriodicSchedulerTest(unittest.TestCase):
             
     def test_once_schedule_before_the_day(self):
         the_day = self.once_scheduler_2021_5_15.next_occurrance_after(date(2021, 5, 14).toordinal())
-        self.assertEqual(the_day.date(), date(2021, 5, 15))
\ No newline at end of file
+        self.assertEqual(the_day.date(), date(2021, 5, 15))
+
+class ScheduledTaskTest(unittest.TestCase):
+    def setUp(self) -> None:
+        import db
+        db.open_database(":memory:")
+
+    def test_generate_weekly_task(self):
+        wednesday = date(2021, 5, 12).toordinal()
+        schedule = ScheduledTask(title='Weekly', tomato=2, once=0, type='-',
+            **PeriodicScheduler(-1, -1, -1, Weekdays.WEDNESDAY).repeat_fields())
+        task, changed = schedule.generate_for_date(wednesday - 1)
+        self.assertIsNone(task)
+        self.assertEqual(schedule.next_event, wednesday)
+        task, changed = schedule.generate_for_date(wednesday)
+        self.assertEqual(task.description, 'Weekly')
+        self.assertEqual(changed, ['last_gen'])
+        self.assertIsNone(task.id, 'the task is not saved yet')
+
+    def test_generate_until_catches_up_missed_days(self):
+        wednesday = date(2021, 5, 12).toordinal()
+        schedule = ScheduledTask(title='Weekly', tomato=2, once=wednesday + 1, type='-',
+            **PeriodicScheduler(-1, -1, -1, Weekdays.WEDNESDAY).repeat_fields(),
+            next_event=wednesday, last_gen=wednesday - 1)
+        tasks, changed = schedule.generate_until(wednesday + 14)
+        self.assertEqual([day - wednesday for day, _ in tasks], [0, 1, 7, 14])
+        self.assertEqual(changed, ['last_gen', 'next_event'])
+        self.assertEqual(schedule.next_event, wednesday + 14)
+        tasks, _ = schedule.generate_until(wednesday + 40, catch_up_days=10)
+        self.assertEqual([day - wednesday for day, _ in tasks], [35])
+
+    def test_generate_all_until(self):
+        wednesday = date(2021, 5, 12).toordinal()
+        weekly = PeriodicScheduler(-1, -1, -1, Weekdays.WEDNESDAY).repeat_fields()
+        schedules = [
+            ScheduledTask(title='Away', once=0, **weekly, next_event=wednesday, last_gen=wednesday - 1),
+            ScheduledTask(title='Yesterday', once=0, **weekly, next_event=wednesday, last_gen=wednesday + 13),
+            ScheduledTask(title='New', once=0, **weekly),
+            ScheduledTask(title='Examined', once=0, **weekly, next_event=wednesday + 21, last_gen=wednesday + 14),
+        ]
+        generated, changed = ScheduledTask.generate_all_until(schedules, wednesday + 14)
+        self.assertEqual([(day - wednesday, schedule.title) for day, schedule, _ in generated],
+            [(0, 'Away'), (7, 'Away'), (14, 'Away'), (14, 'Yesterday'), (14, 'New')])
+        self.assertEqual(changed, [['last_gen', 'next_event']] * 3 + [[]])
+        self.assertEqual([schedule.next_event - wednesday for schedule in schedules], [14, 14, 14, 21])
+
+    def test_new_schedule_is_not_caught_up(self):
+        wednesday = date(2021, 5, 12).toordinal()
+        schedule = ScheduledTask(title='Weekly', tomato=2, once=0, type='-',
+            **PeriodicScheduler(-1, -1, -1, Weekdays.WEDNESDAY).repeat_fields())
+        tasks, _ = schedule.generate_until(wednesday)
+        self.assertEqual([day for day, _ in tasks], [wednesday])
+
+    def test_one_time_schedule_is_done_after_the_day(self):
+        day = date(2021, 5, 12).toordinal()
+        schedule = ScheduledTask.create(title='Once', tomato=1, once=day, type='.')
+        todo = schedule.get_task_for_date(day)
+        self.assertIsNotNone(todo.id)
+        self.assertTrue(schedule.done)
+
+class OccurrencesBetweenTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.first = date(2023, 12, 20).toordinal()
+        self.last = date(2025, 3, 10).toordinal()
+
+    def expected(self, scheduler):
+        "The matching days, found one day at a time with `next_occurrance_after`."
+        days = []
+        for day in range(self.first, self.last + 1):
+            occurrence = scheduler.next_occurrance_after(day)
+            if occurrence is not None and occurrence.date().toordinal() == day:
+                days.append(day)
+        return days
+
+    def test_patterns_match_next_occurrance(self):
+        for pattern in [(-1, -1, -1, Weekdays.WEDNESDAY), (-1, -1, -1, Weekdays.MONDAY),
+                (-1, -1, 15, -1), (-1, -1, 31, -1), (-1, 2, 29, -1), (-1, 12, 25, -1),
+                (2024, 2, 30, -1), (2026, 1, 1, -1)]:
+            scheduler = PeriodicScheduler(*pattern)
+            with self.subTest(pattern=pattern):
+                self.assertEqual(scheduler.occurrences_between(self.first, self.last), self.expected(scheduler))
+
+    def test_leap_day_falls_back_to_the_end_of_february(self):
+        days = PeriodicScheduler(-1, 2, 29, -1).occurrences_between(self.first, self.last)
+        self.assertEqual([date.fromordinal(day) for day in days], [date(2024, 2, 29), date(2025, 2, 28)])
+
+    def test_empty_pattern(self):
+        self.assertEqual(PeriodicScheduler().occurrences_between(self.first, self.last), [])
+
+    def test_expand(self):
+        wednesday = date(2021, 5, 12).toordinal()
+        weekly = PeriodicScheduler(-1, -1, -1, Weekdays.WEDNESDAY).repeat_fields()
+        schedules = [
+            ScheduledTask(title='Weekly', once=0, **weekly),
+            ScheduledTask(title='Once', once=wednesday + 1),
+            ScheduledTask(title='Both', once=wednesday + 2, **weekly),
+            ScheduledTask(title='Done', once=0, **weekly, done=True),
+        ]
+        occurrences = [(day - wednesday, schedule.title) for day, schedule in
+            ScheduledTask.expand(schedules, wednesday, wednesday + 7)]
+        self.assertEqual(occurrences, [(0, 'Weekly'), (0, 'Both'), (1, 'Once'),
+            (2, 'Both'), (7, 'Weekly'), (7, 'Both')])
+
+class RepeatFieldsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        import db
+        db.open_database(":memory:")
+
+    def test_schedules_share_the_scheduler(self):
+        fields = PeriodicScheduler(-1, -1, 15, -1).repeat_fields()
+        first = ScheduledTask.create(title='First', tomato=1, once=0, type='-', **fields)
+        second = ScheduledTask(title='Second', tomato=1, once=0, type='-', **fields)
+        self.assertIs(first.scheduler, second.scheduler)
+        self.assertEqual(first.scheduler.type, 'm')
+        self.assertIsNone(ScheduledTask(title='Once', once=1).scheduler.type)
+
+    def test_filter_by_repeat_type(self):
+        for weekday in [Weekdays.MONDAY, Weekdays.FRIDAY]:
+            ScheduledTask.create(title='Weekly', tomato=1, once=0, type='-',
+                **PeriodicScheduler(weekday=weekday).repeat_fields())
+        ScheduledTask.create(title='Once', tomato=1, once=738000, type='-')
+        rows = ScheduledTask.execute_query(
+            'SELECT repeat_type, count(*) FROM repeated_task GROUP BY repeat_type ORDER BY 1', ())
+        self.assertEqual([tuple(row) for row in rows], [(None, 1), ('w', 2)])
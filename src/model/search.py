@@ -0,0 +1,69 @@
+"""Full-text search of the session notes, and the task and todo descriptions.
+
+The text is indexed by the FTS5 tables `session_fts`, `task_fts` and
+`todo_fts` (see migration 3 in `migrations`). The results of the three tables
+are ranked together by bm25, the best match first.
+
+The results are paginated by the last result of the previous page, so a page
+is found by the indexes, however deep it is:
+
+    page = search('meeting')
+    next_page = search('meeting', after=page[-1])
+"""
+from collections import namedtuple
+import re
+
+import db
+
+# `time` is the start of a session, or the creation time of a todo (tasks
+# have no time)
+SearchResult = namedtuple('SearchResult', 'rank kind id snippet time')
+
+KINDS = ['session', 'task', 'todo']
+
+_TIME_COLUMNS = {
+    'session': 't.start',
+    'task': 'NULL',
+    'todo': 't.create_time',
+}
+
+def make_match_query(text, prefix=True):
+    """Convert the user's input to a FTS5 query, or return '' if there is nothing to search.
+
+    All the words must match. A word ending with `*` is a prefix, and if
+    `prefix` is true, so is the last word (for searching while typing).
+    Other FTS5 syntax is not supported, the words are quoted.
+    """
+    words = re.findall(r'\w+\*?', text)
+    if prefix and words and not words[-1].endswith('*'):
+        words[-1] += '*'
+    return ' '.join(f'"{word[:-1]}"*' if word.endswith('*') else f'"{word}"'
+        for word in words)
+
+def _search_sql(kinds, paginated):
+    selects = []
+    for kind in kinds:
+        time = _TIME_COLUMNS[kind]
+        selects.append(f"""SELECT {kind}_fts.rank AS rank, '{kind}' AS kind, t.id AS id,
+                snippet({kind}_fts, 0, '[', ']', '...', 10) AS snippet, {time} AS time
+            FROM {kind}_fts JOIN {kind} AS t ON t.id = {kind}_fts.rowid
+            WHERE {kind}_fts MATCH :query""")
+    where = 'WHERE (rank, kind, id) > (:rank, :kind, :id)' if paginated else ''
+    return f"""SELECT * FROM ({' UNION ALL '.join(selects)}) {where}
+        ORDER BY rank, kind, id LIMIT :limit"""
+
+def search(text, limit=20, after=None, kinds=KINDS, prefix=True):
+    """Return a list of at most `limit` `SearchResult`s that match `text`.
+
+    `after` is the last result of the previous page. `kinds` limits the
+    search to some of 'session', 'task' and 'todo'. See `make_match_query`
+    for `prefix`.
+    """
+    query = make_match_query(text, prefix)
+    if not query or not kinds:
+        return []
+    parameters = dict(query=query, limit=limit)
+    if after is not None:
+        parameters.update(rank=after.rank, kind=after.kind, id=after.id)
+    sql = _search_sql(tuple(kinds), after is not None)
+    return [SearchResult(*row) for row in db.execute_query(sql, parameters)]
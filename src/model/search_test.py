@@ -0,0 +1,47 @@
+import unittest
+
+import db
+from .models import Session, Task, Todo
+from .search import make_match_query, search
+
+class SearchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        db.open_database(':memory:')
+        self.task = Task.create(description='Write the quarterly report', tomato=3, parent=None)
+        self.todo = Todo.create('Send the report to Alice')
+        self.sessions = [Session.create(self.task.id, 1600000000 + i * 1800, 1600001500 + i * 1800,
+            f'draft {i}: report' if i % 2 else f'meeting {i}') for i in range(10)]
+
+    def test_make_match_query(self):
+        self.assertEqual(make_match_query('quarterly rep'), '"quarterly" "rep"*')
+        self.assertEqual(make_match_query('rep* "x" AND', prefix=False), '"rep"* "x" "AND"')
+        self.assertEqual(make_match_query(' -"( '), '')
+
+    def test_search_all_kinds(self):
+        results = search('report', limit=100)
+        self.assertEqual(sorted((r.kind, r.id) for r in results),
+            [('session', s.id) for s in self.sessions[1::2]] + [('task', self.task.id), ('todo', self.todo.id)])
+        self.assertEqual([r.rank for r in results], sorted(r.rank for r in results))
+        self.assertIn('[report]', results[0].snippet)
+
+    def test_prefix_search(self):
+        self.assertEqual([r.id for r in search('quart')], [self.task.id])
+        self.assertEqual(search('quart', prefix=False), [])
+        self.assertEqual([r.kind for r in search('alice rep', kinds=['todo'])], ['todo'])
+
+    def test_pagination(self):
+        pages = [search('report', limit=3)]
+        while pages[-1]:
+            pages.append(search('report', limit=3, after=pages[-1][-1]))
+        self.assertEqual([len(page) for page in pages], [3, 3, 1, 0])
+        results = [r for page in pages for r in page]
+        self.assertEqual(results, search('report', limit=100))
+
+    def test_index_follows_changes(self):
+        self.todo.description = 'Call Bob'
+        self.todo.save_to_db()
+        self.assertEqual([r.id for r in search('bob')], [self.todo.id])
+        self.assertEqual(search('alice'), [])
+        self.sessions[0].delete_from_db()
+        self.assertEqual(search('meeting 0', prefix=False), [])
+        self.assertEqual(len(search('meeting')), 4)
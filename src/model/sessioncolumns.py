@@ -0,0 +1,141 @@
+"""A column store of the sessions, for the statistic charts.
+
+Loading 100k sessions as `Session` objects takes seconds, while the charts
+only need three numbers of each session. `SessionColumns` keeps the columns
+`start`, `end` and `task` in `array('q')` buffers (8 bytes per value), and
+computes the statistics with NumPy when it's installed, or with plain loops
+otherwise.
+
+The store is refreshed incrementally: only the sessions with an id above the
+last loaded one are read.
+"""
+from array import array
+from datetime import date
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import db
+
+# the ordinal of 1970-01-01, to convert days since the epoch to date ordinals
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# 1970-01-01 was a Thursday
+EPOCH_WEEKDAY = 3
+
+class SessionColumns:
+    """The `start`, `end` and `task` columns of the session table.
+
+    `local_start` is `start` shifted to the local time zone, so that the hour
+    and the day of a session are simple divisions. A session is counted in
+    the hour and the day it started. Sessions without a task are counted as
+    task 0.
+    """
+    def __init__(self, use_numpy=None):
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self.last_id = 0
+        self.start = array('q')
+        self.end = array('q')
+        self.task = array('q')
+        self.local_start = array('q')
+
+    def __len__(self):
+        return len(self.start)
+
+    def refresh(self, batch_size=10000):
+        """Load the sessions created since the last refresh. Return the number of new sessions."""
+        sql = """SELECT id, start, end, coalesce(task, 0),
+                    CAST(strftime('%s', start, 'unixepoch', 'localtime') AS INTEGER)
+                FROM session WHERE id > ? ORDER BY id"""
+        loaded = 0
+        # plain tuples, they are unpacked right away
+        plain_rows = lambda cursor, row: row
+        for rows in db.iter_batches(sql, (self.last_id,), batch_size, plain_rows):
+            ids, starts, ends, tasks, local_starts = zip(*rows)
+            self.start.extend(starts)
+            self.end.extend(ends)
+            self.task.extend(tasks)
+            self.local_start.extend(local_starts)
+            self.last_id = ids[-1]
+            loaded += len(rows)
+        return loaded
+
+    def _numpy_columns(self):
+        """Return NumPy views (no copying) of the columns."""
+        return tuple(numpy.frombuffer(column, dtype=numpy.int64)
+            for column in (self.local_start, self.end, self.start, self.task))
+
+    def minutes_by_hour(self):
+        """Return a list of the focus minutes of each hour of the day (0-23)."""
+        return self._minutes_by_bucket(24, lambda local_start: local_start // 3600 % 24)
+
+    def minutes_by_weekday(self):
+        """Return a list of the focus minutes of each weekday, Monday is 0."""
+        return self._minutes_by_bucket(7,
+            lambda local_start: (local_start // 86400 + EPOCH_WEEKDAY) % 7)
+
+    def _minutes_by_bucket(self, n_buckets, bucket_of):
+        if self.use_numpy:
+            local_start, end, start, _ = self._numpy_columns()
+            seconds = numpy.bincount(bucket_of(local_start), weights=end - start,
+                minlength=n_buckets)
+            return (seconds / 60).tolist()
+        seconds = [0] * n_buckets
+        for local_start, start, end in zip(self.local_start, self.start, self.end):
+            seconds[bucket_of(local_start)] += end - start
+        return [s / 60 for s in seconds]
+
+    def minutes_by_task(self):
+        """Return a dict of {task id: focus minutes}."""
+        if self.use_numpy:
+            _, end, start, task = self._numpy_columns()
+            tasks, index = numpy.unique(task, return_inverse=True)
+            seconds = numpy.bincount(index, weights=end - start)
+            return dict(zip(tasks.tolist(), (seconds / 60).tolist()))
+        seconds = {}
+        for task, start, end in zip(self.task, self.start, self.end):
+            seconds[task] = seconds.get(task, 0) + end - start
+        return {task: s / 60 for task, s in seconds.items()}
+
+    def days(self):
+        """Return the sorted list of the days (as date ordinals) that have sessions."""
+        if self.use_numpy:
+            local_start = self._numpy_columns()[0]
+            return (numpy.unique(local_start // 86400) + EPOCH_ORDINAL).tolist()
+        return sorted({local_start // 86400 + EPOCH_ORDINAL for local_start in self.local_start})
+
+    def streaks(self):
+        """Return a list of (first day, number of days) of the runs of consecutive days with sessions."""
+        days = self.days()
+        if not days:
+            return []
+        if self.use_numpy:
+            days = numpy.array(days)
+            breaks = numpy.flatnonzero(numpy.diff(days) != 1) + 1
+            firsts = numpy.concatenate(([0], breaks))
+            lengths = numpy.diff(numpy.concatenate((firsts, [len(days)])))
+            return list(zip(days[firsts].tolist(), lengths.tolist()))
+        streaks = []
+        first = previous = days[0]
+        for day in days[1:]:
+            if day != previous + 1:
+                streaks.append((first, previous - first + 1))
+                first = day
+            previous = day
+        streaks.append((first, previous - first + 1))
+        return streaks
+
+    def longest_streak(self):
+        """Return the length of the longest streak, in days."""
+        return max((length for _, length in self.streaks()), default=0)
+
+    def current_streak(self, today=None):
+        """Return the length of the streak that ends today or yesterday."""
+        today = (today or date.today()).toordinal()
+        streaks = self.streaks()
+        if streaks:
+            first, length = streaks[-1]
+            if first + length - 1 >= today - 1:
+                return length
+        return 0
@@ -0,0 +1,61 @@
+import unittest
+from datetime import date, datetime
+
+import db
+from . import sessioncolumns
+from .models import Session
+from .sessioncolumns import SessionColumns
+
+def create_session(task, day, hour, minutes=25):
+    start = int(datetime(day.year, day.month, day.day, hour, 10).timestamp())
+    Session.create(task, start, start + minutes * 60, '')
+
+class SessionColumnsTest(unittest.TestCase):
+    use_numpy = False
+
+    def setUp(self) -> None:
+        db.open_database(':memory:')
+        # 2021-05-10 is a Monday
+        for task, day, hour in [(1, 10, 9), (1, 11, 9), (2, 11, 14), (1, 12, 23), (2, 15, 9)]:
+            create_session(task, date(2021, 5, day), hour)
+        self.columns = SessionColumns(self.use_numpy)
+        self.assertEqual(self.columns.refresh(batch_size=2), 5)
+
+    def test_minutes_by_hour(self):
+        minutes = self.columns.minutes_by_hour()
+        self.assertEqual(len(minutes), 24)
+        self.assertEqual((minutes[9], minutes[14], minutes[23]), (75, 25, 25))
+        self.assertEqual(sum(minutes), 125)
+
+    def test_minutes_by_weekday(self):
+        self.assertEqual(self.columns.minutes_by_weekday(), [25, 50, 25, 0, 0, 25, 0])
+
+    def test_minutes_by_task(self):
+        self.assertEqual(self.columns.minutes_by_task(), {1: 75, 2: 50})
+
+    def test_streaks(self):
+        self.assertEqual(self.columns.streaks(),
+            [(date(2021, 5, 10).toordinal(), 3), (date(2021, 5, 15).toordinal(), 1)])
+        self.assertEqual(self.columns.longest_streak(), 3)
+        self.assertEqual(self.columns.current_streak(date(2021, 5, 16)), 1)
+        self.assertEqual(self.columns.current_streak(date(2021, 5, 17)), 0)
+
+    def test_refresh_loads_only_new_sessions(self):
+        create_session(3, date(2021, 5, 16), 9, 50)
+        self.assertEqual(self.columns.refresh(), 1)
+        self.assertEqual(len(self.columns), 6)
+        self.assertEqual(self.columns.minutes_by_task()[3], 50)
+        self.assertEqual(self.columns.longest_streak(), 3)
+        self.assertEqual(self.columns.streaks()[-1][1], 2)
+        self.assertEqual(self.columns.refresh(), 0)
+
+    def test_empty(self):
+        columns = SessionColumns(self.use_numpy)
+        self.assertEqual(columns.minutes_by_weekday(), [0] * 7)
+        self.assertEqual(columns.minutes_by_task(), {})
+        self.assertEqual(columns.streaks(), [])
+        self.assertEqual(columns.current_streak(), 0)
+
+@unittest.skipIf(sessioncolumns.numpy is None, 'NumPy is not installed')
+class NumpySessionColumnsTest(SessionColumnsTest):
+    use_numpy = True
@@ -0,0 +1,210 @@
+"""Import tasks from a text file, one extended task description per line.
+
+The lines have the format of `taskparser.parse_task_description`, as in the
+"Add Task" dialog. A line becomes a `Task`, a `Todo` (`=.`), or a
+`ScheduledTask` (`@date` or `*repeat`). Blank lines are skipped.
+
+`^parent^` refers to the first task whose title starts with the given text:
+an unfinished task in the database, or else a task imported from the same
+file (in any line).
+
+Large files are parsed in a process pool. The new rows are saved in
+transactions of `batch_size` rows, the parents before their subtasks. The
+lines that can't be imported are reported with the reason, the other lines
+are imported anyway.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import functools
+import itertools
+import os
+
+import db
+from model import models
+from model.scheduledtask import PeriodicScheduler, ScheduledTask
+from taskparser import FIRST_DAY, parse_task_description, parse_date_spec, parse_repeat_pattern
+
+# files with more lines than this are parsed in a process pool
+PARALLEL_THRESHOLD = 20000
+BATCH_SIZE = 1000
+
+LineError = namedtuple('LineError', 'line_number text message')
+ImportReport = namedtuple('ImportReport', 'tasks todos schedules errors')
+
+def parse_line(text, today):
+    """Parse a line, return a tuple of (kind, fields, parent title).
+
+    `kind` is 'task', 'todo' or 'schedule', and `fields` are the arguments
+    of the model class. A ValueError is raised if the line is not valid.
+    """
+    options = parse_task_description(text)
+    title = options.get('title', '')
+    if not title:
+        raise ValueError("the task description can't be empty")
+    task_type = options.get('type', ScheduledTask.SHORT)
+    if task_type not in (ScheduledTask.LONG, ScheduledTask.SHORT, ScheduledTask.TODO):
+        raise ValueError(f'unknown duration type "={task_type}"')
+    tomato = options.get('tomato', 0)
+    if tomato == 0 and task_type != ScheduledTask.TODO:
+        raise ValueError('a normal task must specify the number of tomatoes (#n)')
+
+    def parse_date(name):
+        spec = options.get(name)
+        if not spec:
+            return None
+        day = parse_date_spec(spec, today)
+        if day == FIRST_DAY:
+            raise ValueError(f'invalid or past date "{spec}"')
+        return day.toordinal()
+
+    once = parse_date('once')
+    if once is not None or 'pattern' in options:
+        pattern = []
+        if 'pattern' in options:
+            pattern = parse_repeat_pattern(options['pattern'], today)
+            if not pattern:
+                raise ValueError(f'invalid repeat pattern "{options["pattern"]}"')
+        fields = dict(title=title.capitalize(), tomato=tomato, type=task_type,
+            once=once or 0, **PeriodicScheduler(*pattern).repeat_fields())
+        return 'schedule', fields, None
+    deadline = parse_date('deadline')
+    if task_type == ScheduledTask.TODO:
+        return 'todo', dict(description=title, deadline=deadline or 0), None
+    fields = dict(description=title.capitalize(), tomato=tomato,
+        long_session=task_type == ScheduledTask.LONG, parent=None, deadline=deadline)
+    return 'task', fields, options.get('parent')
+
+def _parse_or_report(today, text):
+    """Like `parse_line`, but return ('error', message, None) for an invalid line."""
+    try:
+        return parse_line(text, today)
+    except ValueError as e:
+        return 'error', str(e), None
+    except Exception as e:
+        return 'error', f"can't parse the line ({type(e).__name__}: {e})", None
+
+def parse_lines(texts, today, parallel=None):
+    """Parse the lines, in a process pool if `parallel` (default: if there are many lines)."""
+    parse = functools.partial(_parse_or_report, today)
+    if parallel is None:
+        parallel = len(texts) > PARALLEL_THRESHOLD
+    if not parallel:
+        return [parse(text) for text in texts]
+    workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(parse, texts, chunksize=max(1, len(texts) // (workers * 4))))
+
+def import_lines(lines, today=None, parallel=None, batch_size=BATCH_SIZE):
+    """Import the task descriptions of `lines`, return an `ImportReport`.
+
+    The report has the numbers of the imported tasks, todos and schedules,
+    and a list of `LineError` of the lines that are not imported.
+    """
+    today = today or datetime.today()
+    numbered = [(n, line.strip()) for n, line in enumerate(lines, 1) if line.strip()]
+    parsed = parse_lines([text for _, text in numbered], today, parallel)
+
+    errors, tasks, todos, schedules = [], [], [], []
+    for (n, text), (kind, value, parent) in zip(numbered, parsed):
+        if kind == 'error':
+            errors.append(LineError(n, text, value))
+        elif kind == 'task':
+            tasks.append((n, text, models.Task(**value), parent))
+        elif kind == 'todo':
+            todos.append(models.Todo(**value))
+        else:
+            schedules.append(ScheduledTask(**value))
+
+    new_tasks = [task for _, _, task, _ in tasks]
+    levels, parents = _resolve_parents(tasks, errors)
+    errors.sort()
+    for entities in [todos, schedules]:
+        for i in range(0, len(entities), batch_size):
+            _save_batch(entities[i:i + batch_size])
+    # the parents are saved before their subtasks, so their ids are known
+    for level in levels:
+        for i in range(0, len(level), batch_size):
+            batch = level[i:i + batch_size]
+            for index in batch:
+                if index in parents:
+                    new_tasks[index].parent = new_tasks[parents[index]].id
+            _save_batch([new_tasks[index] for index in batch])
+    return ImportReport(sum(map(len, levels)), len(todos), len(schedules), errors)
+
+def _resolve_parents(tasks, errors):
+    """Find the parents of the new tasks `tasks`, a list of (line number, text, task, parent title).
+
+    The parent of a task is set if it's an existing task. If it's a new task,
+    the task must be saved after its parent, so the indexes of the new tasks
+    are returned in levels: the tasks that have no new parent, then their
+    subtasks, and so on. Also return a dict of {index of a task: index of its
+    new parent}. The tasks whose parent can't be found, or that are in a
+    cycle of parents, are reported in `errors`.
+    """
+    existing = [(row.description.lower(), row.id) for row in models.Task.iter_rows(
+        ['id', 'description'], {'description <>': ''}, order_by='id', done=0)]
+    new = [(task.description.lower(), i) for i, (_, _, task, _) in enumerate(tasks)]
+
+    # many tasks may share a parent, so the matches of a title are searched once
+    matches = {}
+    def find_parent(i, title):
+        if title not in matches:
+            existing_id = next((task_id for description, task_id in existing
+                if description.startswith(title)), None)
+            new_matches = [] if existing_id is not None else list(itertools.islice(
+                (j for description, j in new if description.startswith(title)), 2))
+            matches[title] = existing_id, new_matches
+        existing_id, new_matches = matches[title]
+        if existing_id is not None:
+            return existing_id, None
+        for j in new_matches:
+            if j != i:
+                return None, j
+        raise ValueError(f'no task matches the parent "^{title}^"')
+
+    parents = {}
+    invalid = {}
+    for i, (_, _, task, parent_title) in enumerate(tasks):
+        if parent_title is None:
+            continue
+        try:
+            parent_id, parent_index = find_parent(i, parent_title)
+        except ValueError as e:
+            invalid[i] = str(e)
+            continue
+        if parent_index is None:
+            task.parent = parent_id
+        else:
+            parents[i] = parent_index
+
+    depths = {}
+    def depth(i, path):
+        """Return the number of new ancestors of a task, or None if it can't be imported."""
+        if i not in depths:
+            if i in invalid or i in path:
+                depths[i] = None
+            elif i not in parents:
+                depths[i] = 0
+            else:
+                parent_depth = depth(parents[i], path | {i})
+                depths[i] = None if parent_depth is None else parent_depth + 1
+        return depths[i]
+
+    levels = []
+    for i, (n, text, _, _) in enumerate(tasks):
+        d = depth(i, frozenset())
+        if d is None:
+            errors.append(LineError(n, text, invalid.get(i, 'the parent can\'t be imported')))
+            continue
+        while len(levels) <= d:
+            levels.append([])
+        levels[d].append(i)
+    return levels, parents
+
+def _save_batch(entities):
+    """Insert the new entities in one transaction."""
+    def save(conn):
+        for cls in [models.Task, models.Todo, ScheduledTask]:
+            cls.bulk_create([e for e in entities if type(e) is cls], conn)
+    db.submit(save, urgent=True).result()
@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime
+
+import db
+import taskimport
+from model import models
+from model.scheduledtask import ScheduledTask
+
+class TaskImportTest(unittest.TestCase):
+    def setUp(self) -> None:
+        db.open_database(':memory:')
+        self.today = datetime(2021, 5, 29)
+        self.existing = models.Task.create(description='Project', tomato=2, parent=None)
+
+    def import_lines(self, text, **kw):
+        return taskimport.import_lines(text.splitlines(), self.today, **kw)
+
+    def tasks(self):
+        return {task.description: task for task in models.Task.query_db()}
+
+    def test_import(self):
+        report = self.import_lines('''
+write report #3 ==
+buy milk =.  !+2
+weekly review #1 *Fri
+dentist #1 @6-15
+''')
+        self.assertEqual(report, taskimport.ImportReport(1, 1, 2, []))
+        task = self.tasks()['Write report']
+        self.assertEqual((task.tomato, task.long_session, task.parent), (3, True, None))
+        todo, = models.Todo.query_db()
+        self.assertEqual((todo.description, todo.deadline), ('buy milk', datetime(2021, 5, 31).toordinal()))
+        schedules = {s.title: s for s in ScheduledTask.query_db()}
+        self.assertEqual(schedules['Weekly review'].scheduler.weekday, 4)
+        self.assertEqual(schedules['Dentist'].once, datetime(2021, 6, 15).toordinal())
+
+    def test_parents(self):
+        report = self.import_lines('''
+step 2 #1 ^step 1^
+step 1 #1 ^chap^
+chapter #2 ^proj^
+''', batch_size=1)
+        self.assertEqual(report.errors, [])
+        tasks = self.tasks()
+        self.assertEqual(tasks['Chapter'].parent, self.existing.id)
+        self.assertEqual(tasks['Step 1'].parent, tasks['Chapter'].id)
+        self.assertEqual(tasks['Step 2'].parent, tasks['Step 1'].id)
+
+    def test_errors(self):
+        report = self.import_lines('''
+no tomato
+ok #1
+bad date #1 @13-45
+bad pattern #1 *every
+orphan #1 ^nothing^
+child of orphan #1 ^orphan^
+a #1 ^b^
+b #1 ^a^
+''')
+        self.assertEqual(report.tasks, 1)
+        self.assertEqual([(e.line_number, e.text) for e in report.errors], [
+            (2, 'no tomato'), (4, 'bad date #1 @13-45'), (5, 'bad pattern #1 *every'),
+            (6, 'orphan #1 ^nothing^'), (7, 'child of orphan #1 ^orphan^'),
+            (8, 'a #1 ^b^'), (9, 'b #1 ^a^')])
+        self.assertIn('^nothing^', report.errors[3].message)
+        self.assertEqual(set(self.tasks()), {'Project', 'Ok'})
+
+    def test_parallel_parsing(self):
+        lines = [f'task {i} #2' for i in range(200)] + ['broken']
+        self.assertEqual(taskimport.parse_lines(lines, self.today, parallel=True),
+            taskimport.parse_lines(lines, self.today, parallel=False))
@@ -124,7 +124,7 @@ def parse_date_spec(pattern, start: datetime=None) -> datetime:
     Return a date, or the `FIRST_DAY` if the pattern is not well formed. 
     """
     if start is None: start = datetime.today()
-    if pattern and pattern[0] == '@': pattern = pattern[1:]
+    if pattern and pattern[0] in '@!': pattern = pattern[1:]
     
     # for patterns that specify an offset
     offset_pat = r'^\+(?P<offset>[0-9]+)(?P<unit>[dwmy])?$'
@@ -0,0 +1,118 @@
+"""One timer for all the timed events of the app.
+
+The events (the start of a new day for the task reload and the date label)
+are kept in a heap by their time, and only the first one is waited for, with
+one `after` call of the Tk event loop. Adding or cancelling an event re-arms the wait if
+the first event changes.
+
+The times are wall clock timestamps, so the start of a day is the local
+midnight of that day, with the time zone's offset on that day: a day may be
+23 or 25 hours long, and the timer still wakes up at the right midnight.
+"""
+from datetime import date, datetime, timedelta
+import heapq
+import itertools
+import math
+import time
+
+def day_start(day):
+    """Return the timestamp of the local midnight when `day` (a date) begins."""
+    # if the midnight doesn't exist (the clock jumps from 23:59 to 01:00),
+    # this is the time of the jump
+    return datetime.combine(day, datetime.min.time()).timestamp()
+
+def next_midnight(now):
+    """Return the timestamp of the local midnight after the timestamp `now`."""
+    return day_start(date.fromtimestamp(now) + timedelta(1))
+
+class Timer:
+    """A timed event of `TimerService`, it can be cancelled."""
+    def __init__(self, service, callback, args):
+        self.service = service
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.service._timer_cancelled(self)
+
+class TimerService:
+    """Call the callbacks at the given times.
+
+    `after(ms, callback)` and `after_cancel(id)` are the methods of a Tk
+    widget, `clock()` returns the current timestamp. The wait is at most
+    `max_wait` seconds, so that a change of the system clock is noticed.
+    """
+    max_wait = 6 * 3600
+
+    def __init__(self, after, after_cancel, clock=time.time):
+        self.after = after
+        self.after_cancel = after_cancel
+        self.clock = clock
+        # [time, sequence number, timer], the sequence number keeps the
+        # timers of the same time in the order they are added
+        self.heap = []
+        self.counter = itertools.count()
+        self.pending = None
+        self.pending_time = None
+
+    def call_at(self, when, callback, *args):
+        """Call `callback(*args)` at the timestamp `when`, return the `Timer`."""
+        timer = Timer(self, callback, args)
+        self._push(when, timer)
+        return timer
+
+    def every_midnight(self, callback):
+        """Call `callback(today)` at the start of every day, return the `Timer` that stops it."""
+        last_day = date.fromtimestamp(self.clock())
+        def on_midnight():
+            nonlocal last_day
+            today = date.fromtimestamp(self.clock())
+            # the timer may wake up early if the clock is set back
+            try:
+                if today != last_day:
+                    last_day = today
+                    callback(today)
+            finally:
+                if not timer.cancelled:
+                    self._push(next_midnight(self.clock()), timer)
+        timer = Timer(self, on_midnight, ())
+        self._push(next_midnight(self.clock()), timer)
+        return timer
+
+    def _push(self, when, timer):
+        heapq.heappush(self.heap, [when, next(self.counter), timer])
+        self._schedule()
+
+    def _timer_cancelled(self, timer):
+        # the cancelled timers are dropped when they reach the top of the heap
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)
+        self._schedule()
+
+    def _schedule(self):
+        """Wait for the first timer, if it's not waited for already."""
+        when = self.heap[0][0] if self.heap else None
+        if when == self.pending_time:
+            return
+        if self.pending is not None:
+            self.after_cancel(self.pending)
+            self.pending = self.pending_time = None
+        if when is not None:
+            delay = min(max(when - self.clock(), 0), self.max_wait)
+            self.pending = self.after(math.ceil(delay * 1000), self._run)
+            self.pending_time = when
+
+    def _run(self):
+        """Call the timers that are due, and wait for the next one."""
+        self.pending = self.pending_time = None
+        now = self.clock()
+        try:
+            while self.heap and self.heap[0][0] <= now:
+                timer = heapq.heappop(self.heap)[2]
+                if not timer.cancelled:
+                    timer.callback(*timer.args)
+        finally:
+            # if a callback fails, the other due timers are called right after
+            self._schedule()
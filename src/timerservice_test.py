@@ -0,0 +1,145 @@
+import os
+import time
+import unittest
+from datetime import date, datetime
+
+from timerservice import TimerService, day_start, next_midnight
+
+class FakeTk:
+    """The `after` and `after_cancel` of Tk, with a clock that is moved by hand."""
+    def __init__(self, now):
+        self.now = now
+        self.calls = {}
+        self.ids = 0
+
+    def after(self, ms, callback):
+        self.ids += 1
+        self.calls[self.ids] = (self.now + ms / 1000, callback)
+        return self.ids
+
+    def after_cancel(self, call_id):
+        del self.calls[call_id]
+
+    def clock(self):
+        return self.now
+
+    def advance_to(self, when):
+        """Move the clock, and run the `after` callbacks that are due on the way."""
+        while self.calls:
+            call_id, (due, callback) = min(self.calls.items(), key=lambda item: item[1][0])
+            if due > when:
+                break
+            del self.calls[call_id]
+            self.now = max(self.now, due)
+            callback()
+        self.now = when
+
+def local_timestamp(*args):
+    return datetime(*args).timestamp()
+
+class TimerServiceTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tk = FakeTk(local_timestamp(2021, 5, 12, 10, 0))
+        self.timers = TimerService(self.tk.after, self.tk.after_cancel, self.tk.clock)
+        self.calls = []
+
+    def test_timers_are_called_in_order_with_one_wait(self):
+        for seconds in [30, 10, 20, 10]:
+            self.timers.call_at(self.tk.now + seconds, self.calls.append, seconds)
+        self.assertEqual(len(self.tk.calls), 1)
+        self.tk.advance_to(self.tk.now + 15)
+        self.assertEqual(self.calls, [10, 10])
+        self.tk.advance_to(self.tk.now + 60)
+        self.assertEqual(self.calls, [10, 10, 20, 30])
+        self.assertEqual(self.tk.calls, {})
+
+    def test_cancelled_timer_is_not_called(self):
+        first = self.timers.call_at(self.tk.now + 10, self.calls.append, 'first')
+        self.timers.call_at(self.tk.now + 20, self.calls.append, 'second')
+        first.cancel()
+        (due, _), = self.tk.calls.values()
+        self.assertEqual(due, self.tk.now + 20)
+        self.tk.advance_to(self.tk.now + 60)
+        self.assertEqual(self.calls, ['second'])
+
+    def test_long_wait_is_split(self):
+        self.timers.call_at(self.tk.now + 3 * 86400, self.calls.append, 'late')
+        (due, _), = self.tk.calls.values()
+        self.assertEqual(due, self.tk.now + TimerService.max_wait)
+        self.tk.advance_to(self.tk.now + 3 * 86400 - 1)
+        self.assertEqual(self.calls, [])
+        self.tk.advance_to(self.tk.now + 1)
+        self.assertEqual(self.calls, ['late'])
+
+    def test_start_of_day(self):
+        self.timers.call_at(day_start(date(2021, 5, 14)), self.calls.append, 'due')
+        self.tk.advance_to(local_timestamp(2021, 5, 13, 23, 59, 59))
+        self.assertEqual(self.calls, [])
+        self.tk.advance_to(local_timestamp(2021, 5, 14, 0, 0, 1))
+        self.assertEqual(self.calls, ['due'])
+
+    def test_every_midnight(self):
+        timer = self.timers.every_midnight(self.calls.append)
+        self.assertEqual(self.timers.heap[0][0], local_timestamp(2021, 5, 13))
+        self.tk.advance_to(local_timestamp(2021, 5, 14, 12))
+        self.assertEqual(self.calls, [date(2021, 5, 13), date(2021, 5, 14)])
+        timer.cancel()
+        self.tk.advance_to(local_timestamp(2021, 5, 20))
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.tk.calls, {})
+
+    def test_failing_callback_does_not_stop_the_timers(self):
+        def fail():
+            raise RuntimeError('failed')
+        self.timers.call_at(self.tk.now + 10, fail)
+        self.timers.call_at(self.tk.now + 10, self.calls.append, 'after')
+        with self.assertRaises(RuntimeError):
+            self.tk.advance_to(self.tk.now + 10)
+        self.tk.advance_to(self.tk.now)
+        self.assertEqual(self.calls, ['after'])
+
+
+@unittest.skipUnless(hasattr(time, 'tzset'), 'the time zone can\'t be changed')
+class DaylightSavingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tz = os.environ.get('TZ')
+
+    def tearDown(self) -> None:
+        if self.tz is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = self.tz
+        time.tzset()
+
+    def set_time_zone(self, tz):
+        os.environ['TZ'] = tz
+        time.tzset()
+
+    def test_short_day(self):
+        self.set_time_zone('America/New_York')
+        # 2021-03-14 has 23 hours
+        midnight = next_midnight(local_timestamp(2021, 3, 14, 12))
+        self.assertEqual(midnight - next_midnight(local_timestamp(2021, 3, 13, 12)), 23 * 3600)
+        self.assertEqual(datetime.fromtimestamp(midnight), datetime(2021, 3, 15))
+
+    def test_long_day(self):
+        self.set_time_zone('America/New_York')
+        # 2021-11-07 has 25 hours
+        midnight = next_midnight(local_timestamp(2021, 11, 7, 12))
+        self.assertEqual(midnight - next_midnight(local_timestamp(2021, 11, 6, 12)), 25 * 3600)
+
+    def test_missing_midnight(self):
+        self.set_time_zone('America/Sao_Paulo')
+        # on 2018-11-04 the clock jumped from 23:59:59 to 01:00
+        midnight = next_midnight(local_timestamp(2018, 11, 3, 12))
+        self.assertEqual(datetime.fromtimestamp(midnight), datetime(2018, 11, 4, 1))
+        self.assertEqual(date.fromtimestamp(midnight - 1), date(2018, 11, 3))
+
+    def test_midnight_timer_across_the_change(self):
+        self.set_time_zone('America/New_York')
+        tk = FakeTk(local_timestamp(2021, 3, 13, 12))
+        timers = TimerService(tk.after, tk.after_cancel, tk.clock)
+        days = []
+        timers.every_midnight(lambda today: days.append((today, datetime.fromtimestamp(tk.now))))
+        tk.advance_to(local_timestamp(2021, 3, 16, 12))
+        self.assertEqual(days, [(date(2021, 3, d), datetime(2021, 3, d)) for d in (14, 15, 16)])